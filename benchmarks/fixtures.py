@@ -0,0 +1,116 @@
+"""Offline benchmark databases: the maps and subareas of backup.sql with
+synthetic quests and objectives"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import os
+import random
+import sqlite3
+
+BACKUP_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "backup.sql")
+START_SUBAREA = 250
+CATEGORY_ID = 19
+
+
+@dataclass
+class SyntheticSpec:
+    """Shape of the generated quest graph"""
+
+    n_quests: int = 300
+    depth: int = 10
+    fan_in: int = 2
+    objectives_per_quest: int = 4
+    n_zones: int = 30
+    or_ratio: float = 0.1
+    skip_ratio: float = 0.2
+    seed: int = 0
+
+
+def build_database(path: str, spec: SyntheticSpec, backup: str = BACKUP_FILE) -> str:
+    """Create the sqlite file at path and return it"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    with open(backup, "r") as backup_file:
+        # the dump has a COMMIT but no BEGIN
+        conn.executescript("BEGIN;\n" + backup_file.read())
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(subareas)")]
+    if "worldmapId" not in columns:
+        conn.execute("ALTER TABLE subareas ADD COLUMN worldmapId INTEGER DEFAULT 1")
+    if conn.execute("SELECT 1 FROM subareas WHERE id=?", (START_SUBAREA,)).fetchone() is None:
+        map_id = 1 + conn.execute("SELECT MAX(id) FROM maps").fetchone()[0]
+        conn.execute(
+            "INSERT INTO subareas VALUES (?, 'Start', ?, 0, 0, 4, 4, 1)",
+            (START_SUBAREA, f"[{map_id}]"),
+        )
+        conn.execute("INSERT INTO maps VALUES (?, 2, 2, ?, 1)", (map_id, START_SUBAREA))
+    add_synthetic_quests(conn, spec)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def add_synthetic_quests(conn: sqlite3.Connection, spec: SyntheticSpec):
+    """Quests spread over spec.depth levels, each one requiring up to
+    spec.fan_in quests of the previous level. A spec.skip_ratio of them also
+    require an ancestor of one of these quests, an edge the transitive
+    reduction of remove_inferable_link has to remove"""
+    rng = random.Random(spec.seed)
+    conn.execute(
+        'CREATE TABLE quests ("id" INTEGER, "name.fr" TEXT, startCriterion TEXT, '
+        "categoryId INTEGER)"
+    )
+    conn.execute(
+        'CREATE TABLE objectives ("index" INTEGER, typeId INTEGER, text TEXT, '
+        "subAreaId INTEGER, questId INTEGER, "
+        + ", ".join(f'"parameters.parameter{i}" INTEGER' for i in range(5))
+        + ")"
+    )
+    # subareas are indexed by name when loaded, only keep the unique names
+    zones = [
+        row[0]
+        for row in conn.execute(
+            "SELECT DISTINCT s.id FROM subareas s JOIN maps m ON m.subAreaId = s.id "
+            'WHERE s."name.fr" IN (SELECT "name.fr" FROM subareas '
+            'GROUP BY "name.fr" HAVING COUNT(*) = 1) ORDER BY s.id'
+        )
+    ]
+    zones = [zone for zone in zones if zone != START_SUBAREA][: spec.n_zones - 1]
+    zones.append(START_SUBAREA)
+
+    levels = [[] for _ in range(max(1, spec.depth))]
+    requested_of = {}
+    quests, objectives = [], []
+    for quest_id in range(1, spec.n_quests + 1):
+        level = (quest_id - 1) * len(levels) // spec.n_quests
+        previous = levels[level - 1] if level > 0 else []
+        requested = rng.sample(previous, min(len(previous), rng.randint(1, spec.fan_in)))
+        if (
+            level > 1
+            and len(requested) > 0
+            and spec.skip_ratio > 0
+            and rng.random() < spec.skip_ratio
+        ):
+            ancestor = rng.choice(requested)
+            for _ in range(rng.randint(1, level - 1)):
+                if len(requested_of[ancestor]) == 0:
+                    break
+                ancestor = rng.choice(requested_of[ancestor])
+            if ancestor not in requested:
+                requested.append(ancestor)
+        requested_of[quest_id] = requested
+        criterion = "&".join(f"Qf={idx}" for idx in requested)
+        if len(requested) > 1 and rng.random() < spec.or_ratio:
+            criterion = "|".join(f"(Qf={idx}&PL>10)" for idx in requested)
+        levels[level].append(quest_id)
+        quests.append((quest_id, f"quest {quest_id}", criterion or "PL>1", CATEGORY_ID))
+        for _ in range(rng.randint(1, spec.objectives_per_quest)):
+            obj_id = len(objectives) + 1
+            objectives.append(
+                (obj_id, 1, f"objective {obj_id}", rng.choice(zones), quest_id, 5, -1, -1, -1, -1)
+            )
+    conn.executemany("INSERT INTO quests VALUES (?, ?, ?, ?)", quests)
+    conn.executemany(
+        "INSERT INTO objectives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", objectives
+    )
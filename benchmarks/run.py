@@ -0,0 +1,210 @@
+"""Offline benchmarks of the loaders, distances, graph reduction and planners.
+
+Run from the repository root::
+
+    python -m benchmarks.run --sizes 300 3000 --out benchmarks.json
+
+Every stage reports its wall time, its throughput and the peak of the
+python allocations (tracemalloc, the memory allocated by clingo itself is
+not seen).
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import dofusdb.data_agg as da
+import dofusdb.dist_func as dist
+import dofusdb.sql_loader as loader
+from benchmarks.fixtures import SyntheticSpec, build_database
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(name: str, func: Callable, items: int | None = None, unit: str = "") -> Dict[str, Any]:
+    """Run func once, return its result in the "value" key with the timings"""
+    tracemalloc.reset_peak()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - start_mem
+    record = {"stage": name, "seconds": seconds, "peak_bytes": peak, "value": value}
+    if items is not None:
+        record["items"] = items
+        record["throughput"] = items / seconds if seconds > 0 else None
+        record["unit"] = f"{unit}/s"
+    print(f"{name:<35} {seconds:>9.3f}s {peak / 1024**2:>9.1f} MiB")
+    return record
+
+
+@contextmanager
+def working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def load_gen_clingo(db: loader.database):
+    """gen_clingo opens dofusdb.sqlite from the working directory on import,
+    import it from the benchmark folder and point it to the benchmark base"""
+    with working_directory(os.path.dirname(os.path.abspath(db.path))):
+        gen_clingo = importlib.import_module("gen_clingo")
+    gen_clingo.db = db
+    return gen_clingo
+
+
+def first_quests(quests: Dict, count: int) -> Dict:
+    """The count first quests, requirements outside of them are removed"""
+    kept = dict(list(sorted(quests.items()))[:count])
+    for quest in kept.values():
+        quest.criterions_group.remove_quests(set(quests) - set(kept))
+    return kept
+
+
+def bench_size(spec: SyntheticSpec, work_dir: str, args) -> List[Dict[str, Any]]:
+    path = os.path.join(work_dir, f"bench_{spec.n_quests}.sqlite")
+    build_database(path, spec)
+    db = loader.database(path)
+    results = []
+
+    record = measure("load_all_quest", db.load_all_quest, spec.n_quests, "quests")
+    quests = record.pop("value")
+    n_objectives = sum(len(quest.objectives) for quest in quests.values())
+    results.append(record)
+
+    record = measure(
+        "remove_inferable_link",
+        lambda: da.remove_inferable_link(quests),
+        spec.n_quests,
+        "quests",
+    )
+    record["removed"] = record.pop("value")
+    results.append(record)
+
+    gen_clingo = load_gen_clingo(db)
+    gen_clingo.compute_dist()
+    record = measure(
+        "convert_to_asp", lambda: gen_clingo.convert_to_asp(quests), n_objectives, "objectives"
+    )
+    record["facts"] = len(record.pop("value"))
+    results.append(record)
+
+    record = measure(
+        "heuristic_plan", lambda: gen_clingo.heuristic_plan(quests), n_objectives, "objectives"
+    )
+    record["cost"] = record.pop("value").cost
+    results.append(record)
+
+    small = first_quests(quests, args.plan_quests)
+    with working_directory(REPO_ROOT):
+        record = measure(
+            "asp_plan_incremental",
+            lambda: gen_clingo.asp_plan_incremental(
+                small, time_limit=args.solve_limit, threads=1
+            ),
+            sum(len(quest.objectives) for quest in small.values()),
+            "objectives",
+        )
+    result = record.pop("value")
+    record.update(
+        {
+            "cost": result.cost,
+            "optimal": result.optimal,
+            "ground_seconds": result.report["phases"]["ground"],
+            "solve_seconds": result.report["phases"]["solve"],
+            "atoms": result.report["statistics"]["atoms"],
+            "rules": result.report["statistics"]["rules"],
+        }
+    )
+    results.append(record)
+
+    for record in results:
+        record["n_quests"] = spec.n_quests
+        record["n_objectives"] = n_objectives
+    db.conn.close()
+    return results
+
+
+def bench_distances(work_dir: str) -> List[Dict[str, Any]]:
+    """Every matrix metric on the subareas of backup.sql"""
+    path = build_database(os.path.join(work_dir, "bench_dist.sqlite"), SyntheticSpec(n_quests=1))
+    db = loader.database(path)
+    subarea_dict = db.load_all_subarea()
+    results = []
+    for metric, dist_func in dist.METRICS_BY_NAME.items():
+        record = measure(
+            f"compute_distance_df[{metric}]",
+            lambda: dist.compute_distance_df(
+                subarea_dict, dist_func, is_sym=True, index_id=True
+            ),
+            len(subarea_dict) ** 2,
+            "pairs",
+        )
+        record.pop("value")
+        results.append(record)
+    db.conn.close()
+    return results
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 3000])
+    parser.add_argument("--depth", type=int, default=10)
+    parser.add_argument("--fan-in", type=int, default=2)
+    parser.add_argument("--objectives", type=int, default=4)
+    parser.add_argument("--zones", type=int, default=30)
+    parser.add_argument("--skip-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plan-quests", type=int, default=4)
+    parser.add_argument("--solve-limit", type=float, default=30)
+    parser.add_argument("--no-distances", action="store_true")
+    parser.add_argument("--out", default="benchmarks.json")
+    args = parser.parse_args(argv)
+
+    tracemalloc.start()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        if not args.no_distances:
+            results.extend(bench_distances(work_dir))
+        for size in args.sizes:
+            spec = SyntheticSpec(
+                n_quests=size,
+                depth=args.depth,
+                fan_in=args.fan_in,
+                objectives_per_quest=args.objectives,
+                n_zones=args.zones,
+                skip_ratio=args.skip_ratio,
+                seed=args.seed,
+            )
+            print(f"--- {size} quests")
+            results.extend(bench_size(spec, work_dir, args))
+    tracemalloc.stop()
+
+    report = {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "args": vars(args),
+        "results": results,
+    }
+    with open(args.out, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
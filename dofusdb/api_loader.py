@@ -1,45 +1,85 @@
 from __future__ import annotations
 
 import dofusdb.model as mod
-from typing import Dict
+import dofusdb.http_cache as hc
+import dofusdb.instrument as instrument
+from typing import Any, Dict, Iterable, List
 import json
 import requests as rq
 
+API_URL = "https://api.dofusdb.fr"
+SUBAREA_SELECT = "$select[]=id&$select[]=name&$select[]=bounds&$select[]=mapIds"
+MAP_SELECT = "$select[]=id&$select[]=posX&$select[]=posY&$select[]=worldMap"
 
+
+response_cache: hc.ResponseCache | None = None
+
+
+def enable_cache(
+    path: str = hc.DEFAULT_PATH,
+    ttl: float | None = hc.DEFAULT_TTL,
+    max_size: int = hc.DEFAULT_MAX_SIZE,
+    offline: bool = False,
+) -> hc.ResponseCache:
+    """Serve every loader request from an on-disk cache, offline mode never uses the network"""
+    global response_cache
+    disable_cache()
+    response_cache = hc.ResponseCache(path, ttl=ttl, max_size=max_size, offline=offline)
+    return response_cache
+
+
+def disable_cache():
+    global response_cache
+    if response_cache is not None:
+        response_cache.close()
+    response_cache = None
+
+
+def get_json(url: str) -> Any:
+    """GET an url of the API and decode the json answer"""
+    if response_cache is not None:
+        body = response_cache.get(url)
+        if body is not None:
+            instrument.count("http.cache_hit")
+            return json.loads(body)
+
+    with instrument.timer("http.request"):
+        raw_answer = rq.get(url)
+    if response_cache is not None and raw_answer.ok:
+        response_cache.put(url, raw_answer.content)
+    return json.loads(raw_answer.content)
+
+
+@instrument.timed("api_loader.load_quest_from_category")
 def load_quest_from_category(
     category_id: int, limit: int = 100, lang: str = "fr"
 ) -> Dict[int, mod.Quest]:
     """Load every quest in a quest category"""
-    raw_answer = rq.get(
-        f"https://api.dofusdb.fr/quests?categoryId={category_id}&$limit={limit}&$select[]=id"
+    quests_json = get_json(
+        f"{API_URL}/quests?categoryId={category_id}&$limit={limit}&$select[]=id"
     )
-    quests_json = json.loads(raw_answer.content)
     quests = {el["id"]: load_quest(el["id"], lang) for el in quests_json["data"]}
     if quests_json["total"] > quests_json["limit"]:
         skip = len(quests)
         while len(quests_json["data"]) > 0:
-            raw_answer = rq.get(
-                f"https://api.dofusdb.fr/quests?categoryId={category_id}&$skip={skip}&$select[]=id"
+            quests_json = get_json(
+                f"{API_URL}/quests?categoryId={category_id}&$skip={skip}&$select[]=id"
             )
-            quests_json = json.loads(raw_answer.content)
             for el in quests_json["data"]:
                 quests[el["id"]] = load_quest(el["id"], lang)
             skip = len(quests)
     return quests
 
 
+@instrument.timed("api_loader.load_all_quests")
 def load_all_quests(lang: str = "fr") -> Dict[int, mod.Quest]:
     """Load every quest in a quest category"""
-    raw_answer = rq.get(f"https://api.dofusdb.fr/quests?$select[]=id")
-    quests_json = json.loads(raw_answer.content)
+    quests_json = get_json(f"{API_URL}/quests?$select[]=id")
     quests = {el["id"]: load_quest(el["id"], lang) for el in quests_json["data"]}
     if quests_json["total"] > quests_json["limit"]:
         skip = len(quests)
         while len(quests_json["data"]) > 0:
-            raw_answer = rq.get(
-                f"https://api.dofusdb.fr/quests?$skip={skip}&$select[]=id"
-            )
-            quests_json = json.loads(raw_answer.content)
+            quests_json = get_json(f"{API_URL}/quests?$skip={skip}&$select[]=id")
             for el in quests_json["data"]:
                 quests[el["id"]] = load_quest(el["id"], lang)
             skip = len(quests)
@@ -71,10 +111,9 @@ def load_following_quests(
     quest: mod.Quest, quests_dict: Dict[int, mod.Quest], lang: str = "fr"
 ):
     """Load any quest that are related (forward) to the provided one"""
-    following_r = rq.get(
-        f"https://api.dofusdb.fr/quests?$skip=0&$select[]=id&startCriterion[$regex]=Qf={quest.idx}($|\)|\|)&lang=fr"
+    following_json = get_json(
+        f"{API_URL}/quests?$skip=0&$select[]=id&startCriterion[$regex]=Qf={quest.idx}($|\)|\|)&lang=fr"
     )
-    following_json = json.loads(following_r.content)
     required = {el["id"]: load_quest(el["id"], lang) for el in following_json["data"]}
     for idx, req_quest in required.items():
         if not idx in quests_dict:
@@ -82,69 +121,118 @@ def load_following_quests(
             load_following_quests(quest, quests_dict)
 
 
+@instrument.timed("api_loader.load_following_ids")
+def load_following_ids(quest_id: int) -> List[int]:
+    """Ids of the quests having the provided one in their start criterion"""
+    following_ids = []
+    skip = 0
+    total = 1
+    while skip < total:
+        following_json = get_json(
+            f"{API_URL}/quests?$skip={skip}&$select[]=id&startCriterion[$regex]=Qf={quest_id}($|\)|\||%26)&lang=fr"
+        )
+        following_ids.extend(el["id"] for el in following_json["data"])
+        if len(following_json["data"]) == 0:
+            break
+        skip += len(following_json["data"])
+        total = following_json["total"]
+    return following_ids
+
+
+@instrument.timed("api_loader.load_quests")
+def load_quests(quest_ids: Iterable[int], lang: str = "fr") -> Dict[int, mod.Quest]:
+    return {quest_id: load_quest(quest_id, lang) for quest_id in quest_ids}
+
+
 def load_quest(quest_id: int, lang: str = "fr") -> mod.Quest:
     """Load a quest from dofus db"""
-    raw_answer = rq.get(f"https://api.dofusdb.fr/quests/{quest_id}")
-
-    quest_json = json.loads(raw_answer.content)
+    quest_json = get_json(f"{API_URL}/quests/{quest_id}")
     return mod.quest_from_json(quest_json, lang)
 
 
 def load_achievement(achievement_id: int) -> mod.Quest:
     """Load an quest achievement as a Quest"""
-    raw_answer = rq.get(f"https://api.dofusdb.fr/achievements/{achievement_id}")
-    quests_json = json.loads(raw_answer.content)
+    quests_json = get_json(f"{API_URL}/achievements/{achievement_id}")
     return mod.quest_achievement_from_json(quests_json)
 
 
-def load_subarea(subarea_id: int) -> mod.SubArea:
-    raw_answer = rq.get(
-        f"https://api.dofusdb.fr/subareas/{subarea_id}?$select[]=id&$select[]=name&$select[]=bounds&$select[]=mapIds"
-    )
-    subarea_json = json.loads(raw_answer.content)
-    subarea_json["maps"] = []
-    for map_id in subarea_json["mapIds"]:
-        raw_maps = rq.get(
-            f"https://api.dofusdb.fr/map-positions/{map_id}?$select[]=id&$select[]=posX&$select[]=posY&$select[]=worldMap"
-        )
-        subarea_json["maps"].append(json.loads(raw_maps.content))
-    return mod.sub_area_from_json(subarea_json)
+def map_positions_path(map_ids: List[int]) -> str:
+    ids_filter = "&".join(f"id[$in][]={map_id}" for map_id in map_ids)
+    return f"/map-positions?{ids_filter}&{MAP_SELECT}"
 
 
-def load_all_subarea() -> Dict[str, mod.SubArea]:
-    subarea_dict = {}
+@instrument.timed("api_loader.load_map_positions")
+def load_map_positions(map_ids: Iterable[int], page_size: int = 50) -> Dict[int, Any]:
+    """Load the position of many maps, page_size maps per request using the id[$in] filter"""
+    map_ids = list(dict.fromkeys(map_ids))
+    positions = {}
+    for start in range(0, len(map_ids), page_size):
+        page = map_ids[start : start + page_size]
+        skip = 0
+        total = len(page)
+        while skip < total:
+            maps_json = get_json(
+                f"{API_URL}{map_positions_path(page)}&$limit={len(page)}&$skip={skip}"
+            )
+            for map_json in maps_json["data"]:
+                positions[map_json["id"]] = map_json
+            if len(maps_json["data"]) == 0:
+                break
+            skip += len(maps_json["data"])
+            total = maps_json["total"]
+    return positions
+
+
+def attach_maps(subarea_json: Any, positions: Dict[int, Any]) -> Any:
+    """Fill subarea_json["maps"] from the loaded positions of its mapIds"""
+    subarea_json["maps"] = [
+        positions[map_id] for map_id in subarea_json["mapIds"] if map_id in positions
+    ]
+    return subarea_json
+
+
+def load_subarea(subarea_id: int, page_size: int = 50) -> mod.SubArea:
+    subarea_json = get_json(f"{API_URL}/subareas/{subarea_id}?{SUBAREA_SELECT}")
+    positions = load_map_positions(subarea_json["mapIds"], page_size)
+    return mod.sub_area_from_json(attach_maps(subarea_json, positions))
+
+
+@instrument.timed("api_loader.load_all_subarea")
+def load_all_subarea(page_size: int = 50) -> Dict[str, mod.SubArea]:
+    subareas_json = []
     skip = 0
     loaded = 1
     while loaded != 0:
-        raw_answer = rq.get(
-            f"https://api.dofusdb.fr/subareas?$skip={skip}&$select[]=id&$select[]=name&$select[]=bounds&$select[]=mapIds"
-        )
-        data_json = json.loads(raw_answer.content)["data"]
-        for subarea_json in data_json:
-            subarea_json["maps"] = []
-            for map_id in subarea_json["mapIds"]:
-                raw_maps = rq.get(
-                    f"https://api.dofusdb.fr/map-positions/{map_id}?$select[]=id&$select[]=posX&$select[]=posY&$select[]=worldMap"
-                )
-                subarea_json["maps"].append(json.loads(raw_maps.content))
-            subarea_dict[subarea_json["name"]["fr"]] = mod.sub_area_from_json(
-                subarea_json
-            )
+        data_json = get_json(f"{API_URL}/subareas?$skip={skip}&{SUBAREA_SELECT}")["data"]
+        subareas_json.extend(data_json)
         loaded = len(data_json)
         skip += loaded
+
+    positions = load_map_positions(
+        [map_id for subarea_json in subareas_json for map_id in subarea_json["mapIds"]],
+        page_size,
+    )
+    subarea_dict = {}
+    for subarea_json in subareas_json:
+        subarea_dict[subarea_json["name"]["fr"]] = mod.sub_area_from_json(
+            attach_maps(subarea_json, positions)
+        )
     return subarea_dict
 
 
+def load_export(file_name: str) -> List[Any]:
+    """Read the elements of a DDB-Downloader json export"""
+    with open(file_name, "r", encoding="utf-8") as export_file:
+        data_json = json.load(export_file)
+    return data_json["data"] if isinstance(data_json, dict) else data_json
+
+
 def load_all_subarea_local(sub_file: str, map_file: str) -> Dict[str, mod.SubArea]:
+    """Load every subarea from subareas.json and map-positions.json exports"""
+    positions = {map_json["id"]: map_json for map_json in load_export(map_file)}
     subarea_dict = {}
-    raw_answer = open(sub_file)
-    data_json = json.loads(raw_answer.content)["data"]
-    for subarea_json in data_json:
-        subarea_json["maps"] = []
-        for map_id in subarea_json["mapIds"]:
-            raw_maps = rq.get(
-                f"https://api.dofusdb.fr/map-positions/{map_id}?$select[]=id&$select[]=posX&$select[]=posY&$select[]=worldMap"
-            )
-            subarea_json["maps"].append(json.loads(raw_maps.content))
-        subarea_dict[subarea_json["name"]["fr"]] = mod.sub_area_from_json(subarea_json)
+    for subarea_json in load_export(sub_file):
+        subarea_dict[subarea_json["name"]["fr"]] = mod.sub_area_from_json(
+            attach_maps(subarea_json, positions)
+        )
     return subarea_dict
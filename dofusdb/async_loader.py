@@ -0,0 +1,323 @@
+"""Asynchronous version of api_loader.
+
+Every request goes through a shared ``ApiClient``: one keep-alive session
+per worker thread, at most ``concurrency`` requests in flight and retries with
+exponential backoff. Answers are served from the api_loader response cache
+when it is enabled. The loaders return the same objects as in api_loader::
+
+    quests = asyncio.run(async_loader.load_quest_from_category(19))
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import threading
+from typing import Any, Dict, Iterable, List
+import requests as rq
+from requests.adapters import HTTPAdapter
+import dofusdb.model as mod
+import dofusdb.api_loader as al
+import dofusdb.http_cache as hc
+import dofusdb.instrument as instrument
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RetryableStatus(Exception):
+    def __init__(self, response: rq.Response) -> None:
+        super().__init__(f"{response.status_code} on {response.url}")
+        self.response = response
+
+
+class ApiClient:
+    """Keep-alive connections with bounded concurrency and retry for the DofusDB API.
+
+    requests.Session is not thread-safe, so each thread of the executor gets
+    its own session (and connection pool).
+    """
+
+    def __init__(
+        self,
+        base_url: str = al.API_URL,
+        concurrency: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30,
+        cache: hc.ResponseCache | None = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._cache = cache
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="dofusdb-http"
+        )
+        self._semaphores = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # a semaphore is bound to the event loop it is first used in
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    @property
+    def session(self) -> rq.Session:
+        """Session of the calling thread"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = rq.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    @property
+    def cache(self) -> hc.ResponseCache | None:
+        return self._cache if self._cache is not None else al.response_cache
+
+    async def get_json(self, path: str) -> Any:
+        """GET ``base_url + path`` and decode the json answer"""
+        url = f"{self.base_url}{path}"
+        cache = self.cache
+        loop = asyncio.get_running_loop()
+        # the cache is a blocking sqlite base, kept off the event loop thread
+        if cache is not None:
+            body = await loop.run_in_executor(self.executor, cache.get, url)
+            if body is not None:
+                instrument.count("http.cache_hit")
+                return json.loads(body)
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.semaphore:
+                    response = await loop.run_in_executor(
+                        self.executor,
+                        partial(self.request, url),
+                    )
+                if response.status_code in RETRY_STATUS:
+                    raise RetryableStatus(response)
+                response.raise_for_status()
+                if cache is not None:
+                    await loop.run_in_executor(
+                        self.executor, cache.put, url, response.content
+                    )
+                return response.json()
+            except (rq.ConnectionError, rq.Timeout, RetryableStatus):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+    def request(self, url: str) -> rq.Response:
+        with instrument.timer("http.request"):
+            return self.session.get(url, timeout=self.timeout)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+    async def __aenter__(self) -> ApiClient:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        self.close()
+
+
+_default_client = None
+
+
+def get_client() -> ApiClient:
+    """Client used when none is given to the loaders"""
+    global _default_client
+    if _default_client is None:
+        _default_client = ApiClient()
+    return _default_client
+
+
+async def load_quest(
+    quest_id: int, lang: str = "fr", client: ApiClient | None = None
+) -> mod.Quest:
+    """Load a quest from dofus db"""
+    client = client or get_client()
+    quest_json = await client.get_json(f"/quests/{quest_id}")
+    return mod.quest_from_json(quest_json, lang=lang)
+
+
+async def load_quests(
+    quest_ids: Iterable[int], lang: str = "fr", client: ApiClient | None = None
+) -> Dict[int, mod.Quest]:
+    """Load many quests concurrently"""
+    quest_ids = list(dict.fromkeys(quest_ids))
+    quests = await asyncio.gather(
+        *(load_quest(quest_id, lang, client) for quest_id in quest_ids)
+    )
+    return dict(zip(quest_ids, quests))
+
+
+async def load_achievement(
+    achievement_id: int, client: ApiClient | None = None
+) -> mod.Quest:
+    """Load an quest achievement as a Quest"""
+    client = client or get_client()
+    achievement_json = await client.get_json(f"/achievements/{achievement_id}")
+    return mod.quest_achievement_from_json(achievement_json)
+
+
+async def load_paginated(
+    path: str, limit: int = 50, client: ApiClient | None = None
+) -> List[Any]:
+    """Load every element of a paginated query, pages after the first one are loaded concurrently"""
+    client = client or get_client()
+    sep = "&" if "?" in path else "?"
+    first = await client.get_json(f"{path}{sep}$limit={limit}&$skip=0")
+    data = list(first["data"])
+    page_size = first.get("limit", limit) or limit
+    if first["total"] > len(data):
+        pages = await asyncio.gather(
+            *(
+                client.get_json(f"{path}{sep}$limit={page_size}&$skip={skip}")
+                for skip in range(len(data), first["total"], page_size)
+            )
+        )
+        for page in pages:
+            data.extend(page["data"])
+    return data
+
+
+async def load_quest_from_category(
+    category_id: int,
+    limit: int = 100,
+    lang: str = "fr",
+    client: ApiClient | None = None,
+) -> Dict[int, mod.Quest]:
+    """Load every quest in a quest category"""
+    quests_json = await load_paginated(
+        f"/quests?categoryId={category_id}&$select[]=id", limit, client
+    )
+    return await load_quests([el["id"] for el in quests_json], lang, client)
+
+
+async def load_all_quests(
+    lang: str = "fr", client: ApiClient | None = None
+) -> Dict[int, mod.Quest]:
+    """Load every quest"""
+    quests_json = await load_paginated("/quests?$select[]=id", client=client)
+    return await load_quests([el["id"] for el in quests_json], lang, client)
+
+
+async def load_quest_from_achievement(
+    achievement_id: int, client: ApiClient | None = None
+) -> Dict[int, mod.Quest]:
+    """Load every quest for an achievement, achievement itself is represented as a Quest"""
+    achievement = await load_achievement(achievement_id, client)
+    quests = {achievement.idx: achievement}
+    quests.update(await load_quests(achievement.requested_quests, client=client))
+    return quests
+
+
+async def load_quest_and_required(
+    quest_id: int,
+    quests_dict: Dict[int, mod.Quest],
+    lang: str = "fr",
+    client: ApiClient | None = None,
+):
+    """Load a specific quest and any quest required to start, level by level."""
+    frontier = [quest_id]
+    while len(frontier) > 0:
+        loaded = await load_quests(frontier, lang, client)
+        quests_dict.update(loaded)
+        frontier = {
+            requested_id
+            for quest in loaded.values()
+            for requested_id in quest.requested_quests
+            if requested_id and requested_id not in quests_dict
+        }
+
+
+async def load_following_ids(
+    quest_id: int, client: ApiClient | None = None
+) -> List[int]:
+    """Ids of the quests having the provided one in their start criterion"""
+    following_json = await load_paginated(
+        f"/quests?$select[]=id&startCriterion[$regex]=Qf={quest_id}($|\\)|\\||%26)&lang=fr",
+        client=client,
+    )
+    return [el["id"] for el in following_json]
+
+
+async def load_following_quests(
+    quest: mod.Quest,
+    quests_dict: Dict[int, mod.Quest],
+    lang: str = "fr",
+    client: ApiClient | None = None,
+):
+    """Load any quest that are related (forward) to the provided one"""
+    frontier = [quest.idx]
+    while len(frontier) > 0:
+        following = await asyncio.gather(
+            *(load_following_ids(quest_id, client) for quest_id in frontier)
+        )
+        new_ids = {
+            idx for ids in following for idx in ids if idx not in quests_dict
+        }
+        quests_dict.update(await load_quests(new_ids, lang, client))
+        frontier = new_ids
+
+
+async def load_map_positions(
+    map_ids: Iterable[int], page_size: int = 50, client: ApiClient | None = None
+) -> Dict[int, Any]:
+    """Load the position of many maps, page_size maps per request, pages loaded concurrently"""
+    map_ids = list(dict.fromkeys(map_ids))
+    pages = await asyncio.gather(
+        *(
+            load_paginated(
+                al.map_positions_path(map_ids[start : start + page_size]),
+                page_size,
+                client,
+            )
+            for start in range(0, len(map_ids), page_size)
+        )
+    )
+    return {map_json["id"]: map_json for page in pages for map_json in page}
+
+
+async def load_subarea(
+    subarea_id: int, page_size: int = 50, client: ApiClient | None = None
+) -> mod.SubArea:
+    client = client or get_client()
+    subarea_json = await client.get_json(f"/subareas/{subarea_id}?{al.SUBAREA_SELECT}")
+    positions = await load_map_positions(subarea_json["mapIds"], page_size, client)
+    return mod.sub_area_from_json(al.attach_maps(subarea_json, positions))
+
+
+async def load_all_subarea(
+    page_size: int = 50, client: ApiClient | None = None
+) -> Dict[str, mod.SubArea]:
+    subareas_json = await load_paginated(f"/subareas?{al.SUBAREA_SELECT}", client=client)
+    positions = await load_map_positions(
+        [map_id for subarea_json in subareas_json for map_id in subarea_json["mapIds"]],
+        page_size,
+        client,
+    )
+    subarea_dict = {}
+    for subarea_json in subareas_json:
+        subarea_dict[subarea_json["name"]["fr"]] = mod.sub_area_from_json(
+            al.attach_maps(subarea_json, positions)
+        )
+    return subarea_dict
@@ -4,26 +4,49 @@ from graphviz import Digraph
 import dofusdb.model as mod
 import dofusdb.api_loader as al
 import dofusdb.graph_creator as gc
+import dofusdb.instrument as instrument
+from dofusdb.quest_graph import QuestGraph
 from typing import Set, Dict, List
 from functools import reduce
 
 
-def complete_quest_dict(quests_dict: Dict[int, mod.Quest]):
-    """Complete the dictionary with every related quest (backward and forward)"""
-    added = 1
-    len_before = len(quests_dict)
-    already_complete = set()
-    while added != 0:
-        added = 0
-        to_complete = quests_dict.keys()
-        load_required(quests_dict, already_complete)
-        added += len(quests_dict) - len_before
-
-        len_before = len(quests_dict)
-        load_following(quests_dict, already_complete)
-        added += len(quests_dict) - len_before
-        already_complete.union(to_complete)
-        print(f"add {added} quest(s)")
+@instrument.timed("data_agg.complete_quest_dict")
+def complete_quest_dict(
+    quests_dict: Dict[int, mod.Quest],
+    source=al,
+    direction: str = "both",
+    max_depth: int | None = None,
+    lang: str = "fr",
+):
+    """Complete the dictionary with every related quest (backward and forward).
+
+    Only the quests discovered at the previous round are expanded, so each quest
+    is expanded once. source is api_loader or a sql_loader.database (anything
+    with load_quests and load_following_ids), direction is "both", "backward"
+    (required quests) or "forward" (following quests) and max_depth limits the
+    number of rounds.
+    """
+    if direction not in ("both", "backward", "forward"):
+        raise ValueError(f"unknown direction {direction}")
+    backward = direction in ("both", "backward")
+    forward = direction in ("both", "forward")
+
+    frontier = list(quests_dict)
+    depth = 0
+    while len(frontier) > 0 and (max_depth is None or depth < max_depth):
+        to_load = set()
+        for quest_id in frontier:
+            if backward:
+                to_load.update(quests_dict[quest_id].requested_quests)
+            if forward:
+                to_load.update(source.load_following_ids(quest_id))
+        loaded = source.load_quests(
+            [quest_id for quest_id in to_load if quest_id not in quests_dict], lang
+        )
+        quests_dict.update(loaded)
+        frontier = list(loaded)
+        depth += 1
+        print(f"add {len(loaded)} quest(s)")
 
 
 def load_required(
@@ -48,11 +71,18 @@ def load_following(
             al.load_following_quests(quest, quests_dict)
 
 
-def remove_inferable_link(quests_dict: Dict[int, mod.Quest]):
-    for idx, quest in quests_dict.items():
-        for r_id in quest.requested_quests:
-            if len(find_longest_path(idx, r_id, quests_dict, [idx])) != 2:
-                quest.criterions_group.remove_quests(set([r_id]))
+@instrument.timed("data_agg.remove_inferable_link")
+def remove_inferable_link(quests_dict: Dict[int, mod.Quest]) -> int:
+    """Remove required quests already implied by another required quest (transitive reduction),
+    return the number of removed links"""
+    redundant = {}
+    for idx, r_id in QuestGraph(quests_dict).redundant_edges():
+        redundant.setdefault(idx, set()).add(r_id)
+    for idx, r_ids in redundant.items():
+        quests_dict[idx].criterions_group.remove_quests(r_ids)
+    removed = sum(len(r_ids) for r_ids in redundant.values())
+    print(f"removed {removed} inferable link(s)")
+    return removed
 
 
 def find_longest_path(
@@ -146,6 +176,7 @@ def replace_class_dependent_quests(quests: Dict[int, mod.Quest]):
 
 
 
+@instrument.timed("data_agg.determine_path")
 def determine_path(
     quest_id: int,
     lang: str = "fr",
@@ -0,0 +1,101 @@
+"""On-disk cache of the subarea distance matrices computed by dist_func"""
+
+from typing import Callable, List, Tuple
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+import dofusdb.model as mod
+import dofusdb.dist_func as dist
+import dofusdb.sql_loader as loader
+
+CACHE_DIR = ".dist_cache"
+SOURCE_TABLES = ("maps", "subareas")
+
+
+def cache_key(metric: str, is_sym: bool, index_id: bool, checksum: str) -> str:
+    return f"{metric}-{'sym' if is_sym else 'asym'}-{'id' if index_id else 'name'}-{checksum}"
+
+
+def default_cache_dir(db: loader.database) -> str:
+    """Cache folder placed next to the sqlite file"""
+    return os.path.join(os.path.dirname(os.path.abspath(db.path)), CACHE_DIR)
+
+
+def load_cached_matrix(path: str) -> Tuple[np.ndarray, List] | None:
+    """Load a matrix (memory-mapped) and its index, None if not in cache"""
+    if not os.path.exists(path + ".npy") or not os.path.exists(path + ".json"):
+        return None
+    with open(path + ".json", "r") as index_file:
+        index = json.load(index_file)
+    return np.load(path + ".npy", mmap_mode="r"), index
+
+
+def store_matrix(path: str, dist_mat: np.ndarray, index: List):
+    """Store a matrix and its index, the matrix is written last so it marks a complete entry"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_index = f"{path}.{os.getpid()}.json.tmp"
+    with open(tmp_index, "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(tmp_index, path + ".json")
+
+    tmp_mat = f"{path}.{os.getpid()}.npy.tmp"
+    with open(tmp_mat, "wb") as mat_file:
+        np.save(mat_file, dist_mat)
+    os.replace(tmp_mat, path + ".npy")
+
+
+def remove_stale_entries(cache_dir: str, key: str):
+    """Remove entries of the same metric computed on an older version of the tables"""
+    prefix = key.rsplit("-", 1)[0]
+    for path in glob.glob(os.path.join(glob.escape(cache_dir), f"{prefix}-*")):
+        if not os.path.basename(path).startswith(key + "."):
+            os.remove(path)
+
+
+def cached_distance_matrix(
+    db: loader.database,
+    dist_func: Callable[[mod.SubArea, mod.SubArea], int] | str,
+    is_sym=False,
+    index_id=False,
+    cache_dir: str | None = None,
+) -> Tuple[np.ndarray, List]:
+    """Same as dist_func.compute_distance_matrix on every subarea of the database,
+    reusing a previous result as long as the maps and subareas tables are unchanged"""
+    metric = dist_func if isinstance(dist_func, str) else dist_func.__name__
+    if metric not in dist.METRICS_BY_NAME:
+        raise ValueError(f"no matrix implementation for distance {metric}")
+
+    if cache_dir is None:
+        if db.path == ":memory:":
+            return dist.compute_distance_matrix(
+                db.load_all_subarea(), metric, is_sym=is_sym, index_id=index_id
+            )
+        cache_dir = default_cache_dir(db)
+
+    key = cache_key(metric, is_sym, index_id, db.tables_checksum(SOURCE_TABLES))
+    path = os.path.join(cache_dir, key)
+    cached = load_cached_matrix(path)
+    if cached is not None:
+        return cached
+
+    dist_mat, index = dist.compute_distance_matrix(
+        db.load_all_subarea(), metric, is_sym=is_sym, index_id=index_id
+    )
+    remove_stale_entries(cache_dir, key)
+    store_matrix(path, dist_mat, index)
+    return dist_mat, index
+
+
+def cached_distance_df(
+    db: loader.database,
+    dist_func: Callable[[mod.SubArea, mod.SubArea], int] | str,
+    is_sym=False,
+    index_id=False,
+    cache_dir: str | None = None,
+) -> pd.DataFrame:
+    dist_mat, index = cached_distance_matrix(
+        db, dist_func, is_sym=is_sym, index_id=index_id, cache_dir=cache_dir
+    )
+    return pd.DataFrame(dist_mat, index=index, columns=index, copy=False)
@@ -1,10 +1,13 @@
-from typing import Dict, Callable
+from typing import Dict, Callable, List, Tuple
 import dofusdb.model as mod
 import numpy as np
 import itertools
 import pandas as pd
 from numba import njit
 
+OTHER_WORLD_DIST = 10000
+BLOCK_SIZE = 2**21  # number of map pairs handled at once by the matrix engine
+
 
 def mean_all_manhattan(subarea_a: mod.SubArea, subarea_b: mod.SubArea) -> int:
     dist = 0
@@ -78,6 +81,12 @@ def compute_distance_df(
     is_sym=False,
     index_id=False,
 ) -> pd.DataFrame:
+    if dist_func in MATRIX_METRICS:
+        dist_mat, index = compute_distance_matrix(
+            subarea_dict, dist_func, is_sym=is_sym, index_id=index_id
+        )
+        return pd.DataFrame(dist_mat, index=index, columns=index)
+
     zones_name = [name for name in subarea_dict.keys()]
     if index_id:
         index = [sub.idx for sub in subarea_dict.values()]
@@ -108,7 +117,143 @@ def compute_distance_df(
             if is_sym:
                 dist_df.loc[to_id, from_id] = dist_df.loc[from_id, to_id]
         else:
-            dist_df.loc[from_id, to_id] = 10000
-            dist_df.loc[to_id, from_id] = 10000
+            dist_df.loc[from_id, to_id] = OTHER_WORLD_DIST
+            dist_df.loc[to_id, from_id] = OTHER_WORLD_DIST
 
     return dist_df
+
+
+class PackedSubAreas:
+    """Coordinates of every map of every subarea, packed in contiguous arrays.
+
+    Maps sharing the same coordinates in a subarea are stored once with a
+    weight, the (unique) maps of subarea ``i`` are
+    ``coords[offsets[i]:offsets[i + 1]]``.
+    """
+
+    def __init__(self, subarea_dict: Dict[str, mod.SubArea], index_id=False) -> None:
+        subareas = list(subarea_dict.values())
+        self.index = (
+            [sub.idx for sub in subareas] if index_id else list(subarea_dict.keys())
+        )
+        self.counts = np.array([len(sub.maps) for sub in subareas], dtype=np.int64)
+        maps = np.array(
+            [(i, m.pos_x, m.pos_y) for i, sub in enumerate(subareas) for m in sub.maps],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        maps, self.weights = np.unique(maps, axis=0, return_counts=True)
+        self.owner = maps[:, 0].astype(np.int64)
+        self.coords = maps[:, 1:]
+        self.offsets = np.searchsorted(self.owner, np.arange(len(subareas) + 1))
+        self.gravity = np.array(
+            [sub.gravity_center for sub in subareas], dtype=np.float64
+        ).reshape(-1, 2)
+        self.world = np.array([sub.worldMapId for sub in subareas])
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def _pair_dist(
+    from_coords: np.ndarray, to_coords: np.ndarray, manhattan: bool
+) -> np.ndarray:
+    """Distance between every point of from_coords (rows) and to_coords (columns)"""
+    dx = from_coords[:, 0, None] - to_coords[None, :, 0]
+    dy = from_coords[:, 1, None] - to_coords[None, :, 1]
+    if manhattan:
+        return np.abs(dx) + np.abs(dy)
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def _all_maps_matrix(packed: PackedSubAreas, manhattan: bool, reduce: str):
+    """Reduce (weighted sum or max) the distance of every map pair, grouped by subareas"""
+    n = len(packed)
+    fill = 0 if reduce == "sum" else -np.inf
+    result = np.full((n, n), fill, dtype=np.float64)
+    non_empty = np.flatnonzero(packed.counts)
+    if len(non_empty) == 0:
+        return result
+    starts = packed.offsets[non_empty]
+    col_reduce = np.add if reduce == "sum" else np.maximum
+    rows = max(1, BLOCK_SIZE // len(packed.coords))
+
+    for start in range(0, len(packed.coords), rows):
+        block = slice(start, start + rows)
+        dist = _pair_dist(packed.coords[block], packed.coords, manhattan)
+        if reduce == "sum":
+            dist *= packed.weights[block, None] * packed.weights[None, :]
+        by_subarea = np.full((dist.shape[0], n), fill, dtype=np.float64)
+        by_subarea[:, non_empty] = col_reduce.reduceat(dist, starts, axis=1)
+        col_reduce.at(result, packed.owner[block], by_subarea)
+    return result
+
+
+def _to_grav_matrix(packed: PackedSubAreas, manhattan: bool) -> np.ndarray:
+    """Sum of the distances between maps of a (rows) and gravity center of b"""
+    n = len(packed)
+    result = np.zeros((n, n), dtype=np.float64)
+    rows = max(1, BLOCK_SIZE // max(1, n))
+    for start in range(0, len(packed.coords), rows):
+        block = slice(start, start + rows)
+        dist = _pair_dist(packed.coords[block], packed.gravity, manhattan)
+        dist *= packed.weights[block, None]
+        np.add.at(result, packed.owner[block], dist)
+    return result
+
+
+def _mean_all_matrix(packed: PackedSubAreas, manhattan: bool) -> np.ndarray:
+    counts = packed.counts.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _all_maps_matrix(packed, manhattan, "sum") / np.outer(counts, counts)
+
+
+def _max_all_matrix(packed: PackedSubAreas, manhattan: bool) -> np.ndarray:
+    result = _all_maps_matrix(packed, manhattan, "max")
+    result[np.isneginf(result)] = 0
+    return result
+
+
+def _mean_to_grav_matrix(packed: PackedSubAreas, manhattan: bool) -> np.ndarray:
+    counts = packed.counts.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _to_grav_matrix(packed, manhattan) / counts[:, None]
+
+
+def _grav_to_grav_matrix(packed: PackedSubAreas, manhattan: bool) -> np.ndarray:
+    return _pair_dist(packed.gravity, packed.gravity, manhattan)
+
+
+MATRIX_METRICS = {
+    mean_all_manhattan: lambda packed: _mean_all_matrix(packed, True),
+    max_all_manhattan: lambda packed: _max_all_matrix(packed, True),
+    mean_manhattan_to_grav: lambda packed: _mean_to_grav_matrix(packed, True),
+    grav_to_grav_manhattan: lambda packed: _grav_to_grav_matrix(packed, True),
+    mean_all_eucl: lambda packed: _mean_all_matrix(packed, False),
+    max_all_eucl: lambda packed: _max_all_matrix(packed, False),
+    grav_to_grav_eucl: lambda packed: _grav_to_grav_matrix(packed, False),
+    mean_eucl_to_grav: lambda packed: _mean_to_grav_matrix(packed, False),
+}
+METRICS_BY_NAME = {func.__name__: func for func in MATRIX_METRICS}
+
+
+def compute_distance_matrix(
+    subarea_dict: Dict[str, mod.SubArea],
+    dist_func: Callable[[mod.SubArea, mod.SubArea], int] | str,
+    is_sym=False,
+    index_id=False,
+) -> Tuple[np.ndarray, List]:
+    """Compute the distance between every subarea at once with one of the metrics above.
+
+    Return the dense distance matrix and its index (names, or ids if ``index_id``),
+    with the same values as ``compute_distance_df``. Subareas without any map get
+    ``nan`` for mean based metrics.
+    """
+    if isinstance(dist_func, str):
+        dist_func = METRICS_BY_NAME[dist_func]
+    packed = PackedSubAreas(subarea_dict, index_id=index_id)
+    dist_mat = MATRIX_METRICS[dist_func](packed)
+    if is_sym:
+        # like compute_distance_df, keep the value computed from the first subarea
+        dist_mat = np.triu(dist_mat) + np.triu(dist_mat, 1).T
+    dist_mat[packed.world[:, None] != packed.world[None, :]] = OTHER_WORLD_DIST
+    return dist_mat, packed.index
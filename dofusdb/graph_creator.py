@@ -1,10 +1,16 @@
 from __future__ import annotations
 import dofusdb.model as mod
-from typing import Dict
-from graphviz import Digraph
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+from graphviz import Digraph, Source
+import hashlib
 import itertools
+import json
+import os
 from numpy import random
 
+RENDER_CACHE_FILE = ".render_cache.json"
+
 COLORSCHEME = [
     "black",
     "aliceblue",
@@ -248,11 +254,12 @@ def graph_from_quests_with_objectives(
             group_criterion=group_criterion,
         )
 
-    for type_id, list_obj in objectives_edges.items():
+    # numbered rather than hash(type_id) so the source is the same from one run to another
+    for i, (type_id, list_obj) in enumerate(objectives_edges.items()):
         if len(list_obj) > 1:
-            dot.node(f"typeobj{hash(type_id)}", f"obj:{type_id[2]}", shape="rectangle")
+            dot.node(f"typeobj{i}", f"obj:{type_id[2]}", shape="rectangle")
             for obj in list_obj:
-                dot.edge(obj, f"typeobj{hash(type_id)}", style="dotted")
+                dot.edge(obj, f"typeobj{i}", style="dotted")
     if render_as is not None:
         dot.format = render_as
         dot.render(graph_name)
@@ -487,3 +494,65 @@ def graph_from_quests_for_asp(
     if render_as is not None:
         dot.format = render_as
     return dot
+
+
+def render_source(source: str, filename: str, render_as: str) -> str:
+    """Run graphviz on a DOT source, in a worker process of render_batch"""
+    return Source(source, filename=filename).render(format=render_as)
+
+
+def render_batch(
+    jobs: List[Tuple[str, Dict[int, mod.Quest], Dict[str, Any]]],
+    directory: str = ".",
+    workers: int | None = None,
+) -> Dict[str, str]:
+    """Render many graphs, skipping the ones whose DOT source did not change.
+
+    A job is (graph name, quests dictionary, options): with_steps picks
+    graph_from_quests_with_objectives over graph_from_quests, render_as is
+    the output format (svg by default) and the other options are passed to
+    the graph builder. The sha256 of each source is kept in
+    RENDER_CACHE_FILE inside directory; jobs with an unchanged hash and an
+    existing output are skipped, the others are rendered in a process pool.
+    Return graph name -> "cached" or "rendered".
+    """
+    cache_path = os.path.join(directory, RENDER_CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+
+    status = {}
+    to_render = []
+    for name, quests_dict, options in jobs:
+        options = dict(options)
+        builder = (
+            graph_from_quests_with_objectives
+            if options.pop("with_steps", False)
+            else graph_from_quests
+        )
+        render_as = options.pop("render_as", "svg")
+        source = builder(name, quests_dict, render_as=None, **options).source
+        digest = hashlib.sha256(f"{render_as}\n{source}".encode()).hexdigest()
+        filename = os.path.join(directory, name)
+        if cache.get(name) == digest and os.path.exists(f"{filename}.{render_as}"):
+            status[name] = "cached"
+        else:
+            to_render.append((name, digest, source, filename, render_as))
+
+    if len(to_render) > 0:
+        os.makedirs(directory, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (name, digest, executor.submit(render_source, source, filename, render_as))
+                for name, digest, source, filename, render_as in to_render
+            ]
+            try:
+                for name, digest, future in futures:
+                    future.result()
+                    cache[name] = digest
+                    status[name] = "rendered"
+            finally:
+                with open(cache_path, "w", encoding="utf-8") as file:
+                    json.dump(cache, file, indent=1)
+    return status
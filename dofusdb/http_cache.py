@@ -0,0 +1,139 @@
+"""SQLite backed cache of the DofusDB API answers"""
+
+from __future__ import annotations
+
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = ".http_cache.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_SIZE = 512 * 1024**2
+ACCESS_FLUSH = 256
+
+
+class OfflineCacheMiss(LookupError):
+    """Raised in offline mode when an url has never been cached"""
+
+
+def normalize_url(url: str) -> str:
+    """Same key for urls only differing by host case or query parameters order"""
+    parts = urlsplit(url)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return urlunsplit(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path.rstrip("/") or "/",
+            urlencode(query, safe="$[]"),
+            "",
+        )
+    )
+
+
+class ResponseCache:
+    """Answers body by normalized url, with a time to live and a LRU eviction
+    once the stored bodies exceed max_size bytes.
+
+    In offline mode entries never expire and a miss raises OfflineCacheMiss.
+    Hits only write their access time in memory, written to the base by
+    batches of ACCESS_FLUSH, on put and on close.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        ttl: float | None = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+        offline: bool = False,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, body BLOB, stored_at REAL, last_access REAL, size INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_responses_access ON responses (last_access)"
+        )
+        self.conn.commit()
+        self.total_size = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.pending_access = {}
+
+    def get(self, url: str) -> Optional[bytes]:
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, stored_at FROM responses WHERE url=?", (key,)
+            ).fetchone()
+            if row is not None and (
+                self.offline or self.ttl is None or now - row[1] <= self.ttl
+            ):
+                self.pending_access[key] = now
+                if len(self.pending_access) >= ACCESS_FLUSH:
+                    self.flush_access()
+                    self.conn.commit()
+                return row[0]
+        if self.offline:
+            raise OfflineCacheMiss(url)
+        return None
+
+    def put(self, url: str, body: bytes):
+        key = normalize_url(url)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE url=?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, body, now, now, len(body)),
+            )
+            self.pending_access.pop(key, None)
+            self.total_size += len(body) - (old[0] if old is not None else 0)
+            self.flush_access()
+            self.evict()
+            self.conn.commit()
+
+    def flush_access(self):
+        """Write the access times of the hits since the last flush"""
+        if len(self.pending_access) > 0:
+            self.conn.executemany(
+                "UPDATE responses SET last_access=? WHERE url=?",
+                [(now, key) for key, now in self.pending_access.items()],
+            )
+            self.pending_access.clear()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size"""
+        if self.total_size <= self.max_size:
+            return
+        for url, size in self.conn.execute(
+            "SELECT url, size FROM responses ORDER BY last_access"
+        ).fetchall():
+            if self.total_size <= self.max_size:
+                break
+            self.conn.execute("DELETE FROM responses WHERE url=?", (url,))
+            self.total_size -= size
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.total_size = 0
+            self.pending_access.clear()
+
+    def close(self):
+        with self.lock:
+            self.flush_access()
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,144 @@
+"""Opt-in counters and timers of the pipeline.
+
+Nothing is recorded until recording is enabled::
+
+    with instrument.recording() as registry:
+        db.load_all_quest()
+    registry.dump()
+
+Each name (``http.request``, ``sql.statement``, a decorated function...)
+keeps its number of calls, total/min/max time and a histogram of the call
+durations.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator
+import bisect
+import json
+import math
+import threading
+import time
+
+# upper bounds (in seconds) of the histogram buckets, the last one is open
+BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class Stat:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.histogram[bisect.bisect_left(BUCKETS, duration)] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound:g}s" for bound in BUCKETS] + [f">{BUCKETS[-1]:g}s"]
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class Registry:
+    """Thread safe statistics by name"""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Stat] = {}
+
+    def record(self, name: str, duration: float = 0.0):
+        with self.lock:
+            if name not in self.stats:
+                self.stats[name] = Stat()
+            self.stats[name].add(duration)
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            return {name: self.stats[name].to_dict() for name in sorted(self.stats)}
+
+    def dump(self, path: str | None = None):
+        """Print a table of the statistics, or write them as json to path"""
+        summary = self.summary()
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(summary, file, indent=2)
+            return
+        print(f"{'name':<45} {'count':>8} {'total (s)':>10} {'mean (ms)':>10}")
+        for name, stat in summary.items():
+            print(
+                f"{name:<45} {stat['count']:>8} {stat['total']:>10.3f} "
+                f"{stat['mean'] * 1000:>10.3f}"
+            )
+
+
+registry = Registry()
+
+
+def count(name: str):
+    """Record an event without duration"""
+    if registry.enabled:
+        registry.record(name)
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Record the duration of the block under name"""
+    if not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.record(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Decorator recording every call of the function under name"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def recording(reset: bool = True) -> Iterator[Registry]:
+    """Enable the recording inside the block"""
+    if reset:
+        registry.reset()
+    previous = registry.enabled
+    registry.enabled = True
+    try:
+        yield registry
+    finally:
+        registry.enabled = previous
@@ -2,11 +2,13 @@ from __future__ import annotations
 from typing import Set, List, Tuple, Any
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum
 import numpy as np
 from numpy.typing import ArrayLike
 import sqlite3
 import json
+import dofusdb.instrument as instrument
 
 
 class CritTypes(Enum):
@@ -68,7 +70,7 @@ class Bound:
         self.y = y
         self.width = width
         self.height = height
-        if gravity_center == None:
+        if gravity_center is None:
             self.gravity_center = np.array([x + width / 2, y + height / 2])
         else:
             self.gravity_center = gravity_center
@@ -227,11 +229,18 @@ class Objective:
             "text": self.text,
         }
 
+    def __reduce__(self):
+        # __dict__ is overridden, so the default pickling can not restore the fields
+        return (
+            Objective,
+            (self.idx, self.type_id, self.parameters, self.sub_area, self.text),
+        )
+
 
 def determine_root_logical_operator(criterion_str: str):
     operator = ""
     parenthese_count = 0
-    split_by_group = set()
+    split_by_group = {}
     buff = ""
     for letter in criterion_str:
         match letter:
@@ -242,18 +251,18 @@ def determine_root_logical_operator(criterion_str: str):
             case "|":
                 if parenthese_count == 0:
                     operator = "or"
-                    split_by_group.add(buff)
+                    split_by_group[buff] = None
                     buff = ""
             case "&":
                 if parenthese_count == 0:
                     operator = "and"
-                    split_by_group.add(buff)
+                    split_by_group[buff] = None
                     buff = ""
 
         if parenthese_count > 0 or not letter in "|&":
             buff += letter
-    split_by_group.add(buff)
-    return operator, split_by_group
+    split_by_group[buff] = None
+    return operator, list(split_by_group)
 
 
 def parse_objectives(steps, lang="fr") -> List[Objective]:
@@ -318,41 +327,124 @@ def objective_from_sql(obj_list: sqlite3.Cursor) -> List[Objective]:
     return objs
 
 
-def criterion_from_str(criterion_str: str) -> LogicalGroup:
-    criterion_list = []
-    # first we want to detect the "root" logical operator
-    main_op, groups = determine_root_logical_operator(criterion_str=criterion_str)
-
-    for crit_group in groups:
-        # boolean interpretation of empty string is false
-        if crit_group[0] == "(" and "|" in crit_group:
-            criterion_list.append(criterion_from_str(crit_group[1:-1]))
+CRITERION_TOKEN = re.compile(
+    r"(?P<crit>(?P<type>\w+)(?P<symbol>[=>!])(?P<value>\d+)?)"
+    r"|(?P<op>[()|&])"
+    r"|(?P<fill>[\d=>!\w])"
+    r"|(?P<sep>.)",
+    re.DOTALL,
+)
+
+
+def tokenize_criterion(criterion_str: str) -> List[Tuple[str, int, int, Any]]:
+    """Split a criterion string in (kind, start, end, value) tokens.
+
+    kind is "crit" (value is (type, symbol, number)), one of "(", ")", "|", "&",
+    "fill" for stray criterion characters or "sep" for any other character.
+    """
+    tokens = []
+    for match in CRITERION_TOKEN.finditer(criterion_str):
+        kind = match.lastgroup
+        if kind == "crit":
+            tokens.append(
+                (
+                    kind,
+                    match.start(),
+                    match.end(),
+                    (match["type"], match["symbol"], match["value"]),
+                )
+            )
+        elif kind == "op":
+            tokens.append((match["op"], match.start(), match.end(), None))
         else:
-            criterion_list_raw = filter(
-                bool, re.findall(r"\(?([\d=>!\w\&]*)\)?\|?", crit_group)
+            tokens.append((kind, match.start(), match.end(), None))
+    return tokens
+
+
+def parse_criterion_tokens(
+    criterion_str: str, tokens: List[Tuple[str, int, int, Any]], start: int, end: int
+) -> Tuple:
+    """Recursive descent on tokens[start:end], return ("group", link_type, children)
+    where children are groups or ("crit", CritTypes, value, negated) tuples"""
+    operator = ""
+    depth = 0
+    bounds = []
+    group_start = start
+    for i in range(start, end):
+        kind = tokens[i][0]
+        if kind == "(":
+            depth += 1
+        elif kind == ")":
+            depth -= 1
+        elif kind in ("|", "&") and depth == 0:
+            operator = "or" if kind == "|" else "and"
+            bounds.append((group_start, i))
+            group_start = i + 1
+    bounds.append((group_start, end))
+
+    # identical groups are only kept once, in order of appearance
+    groups = {}
+    for group_start, group_end in bounds:
+        if group_start < group_end:
+            text = criterion_str[tokens[group_start][1] : tokens[group_end - 1][2]]
+            groups.setdefault(text, (group_start, group_end))
+
+    children = []
+    for group_start, group_end in groups.values():
+        if tokens[group_start][0] == "(" and any(
+            tokens[i][0] == "|" for i in range(group_start, group_end)
+        ):
+            inner_end = group_end - 1 if tokens[group_end - 1][0] == ")" else group_end
+            children.append(
+                parse_criterion_tokens(criterion_str, tokens, group_start + 1, inner_end)
             )
-            for criterion_raw in criterion_list_raw:
-                criterion = filter(
-                    bool, re.findall(r"(\w+)([=>!])(\d+)?", criterion_raw)
-                )
-                crit_group = [
-                    Criterion(
-                        crit_type=CritTypes.parseCrit(crit_type),
-                        crit_value=int(crit_value),
-                        negated=symbole == "!",
-                    )
-                    for crit_type, symbole, crit_value in criterion
-                    if CritTypes.parseCrit(crit_type) != None
-                ]
-                if len(crit_group) > 0:
-                    criterion_list.append(
-                        LogicalGroup(
-                            crit_group,
-                            link_type="and",
+            continue
+
+        # a group without "or" gives one "and" group per run of criterions
+        crits = []
+        for i in range(group_start, group_end + 1):
+            kind = tokens[i][0] if i < group_end else "sep"
+            if kind == "crit":
+                crit_type, symbole, crit_value = tokens[i][3]
+                crit_type = CritTypes.parseCrit(crit_type)
+                if crit_type is not None:
+                    crits.append(
+                        (
+                            "crit",
+                            crit_type,
+                            int(crit_value) if crit_value else None,
+                            symbole == "!",
                         )
                     )
+            elif kind not in ("fill", "&"):
+                if len(crits) > 0:
+                    children.append(("group", "and", tuple(crits)))
+                crits = []
+    return ("group", operator, tuple(children))
+
+
+@lru_cache(maxsize=4096)
+@instrument.timed("model.parse_criterion")
+def parse_criterion(criterion_str: str) -> Tuple:
+    """Immutable parse tree of a criterion string, memoized as many quests share criterions"""
+    tokens = tokenize_criterion(criterion_str)
+    return parse_criterion_tokens(criterion_str, tokens, 0, len(tokens))
+
+
+def group_from_tree(tree: Tuple) -> LogicalGroup:
+    criterions = []
+    for child in tree[2]:
+        if child[0] == "group":
+            criterions.append(group_from_tree(child))
+        else:
+            criterions.append(Criterion(child[1], child[2], negated=child[3]))
+    return LogicalGroup(criterions, link_type=tree[1])
+
 
-    return LogicalGroup(criterion_list, link_type=main_op)
+@instrument.timed("model.criterion_from_str")
+def criterion_from_str(criterion_str: str | None) -> LogicalGroup:
+    # groups are mutated by data_agg so a new tree is built from the memoized parse
+    return group_from_tree(parse_criterion(criterion_str or ""))
 
 
 def quest_from_json(data: Any, pos_data: Any = None, lang: str = "fr") -> Quest:
@@ -0,0 +1,375 @@
+"""Planners working directly on the objectives, without clingo.
+
+They follow the rules of plan.lp: every objective is done once, the
+objectives of a quest are done by increasing id, every objective of a
+required quest is done before the objectives of the quest requiring it and
+the cost of a path is the sum of the distances between consecutive zones,
+starting from the zone 250. The zone -1 (no zone) is at distance 0 of every
+zone.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Sequence, Tuple
+import itertools
+import time
+import numpy as np
+import pandas as pd
+import dofusdb.model as mod
+
+START_ZONE = 250
+NO_ZONE = -1
+
+
+class PlanProblem:
+    """Objectives of a quest dictionary as nodes of a precedence graph.
+
+    Node i is ``objectives[i]`` of the quest ``quest_ids[i]`` in zone
+    ``zones[i]`` (an index of ``zone_ids``). ``preds[i]`` holds the nodes
+    that must be done before node i: the previous objective of the quest and
+    the last objective of every quest it requires.
+    """
+
+    def __init__(self, quests: Dict[int, mod.Quest], dist_mat: pd.DataFrame) -> None:
+        self.objectives: List[mod.Objective] = []
+        self.quest_ids: List[int] = []
+        last_node = {}
+        first_nodes = []
+        for quest in quests.values():
+            nodes = []
+            for obj in sorted(quest.objectives, key=lambda obj: obj.idx):
+                nodes.append(len(self.objectives))
+                self.objectives.append(obj)
+                self.quest_ids.append(quest.idx)
+            if len(nodes) > 0:
+                first_nodes.append((quest, nodes[0]))
+                last_node[quest.idx] = nodes[-1]
+
+        self.preds: List[List[int]] = [
+            [i - 1] if i > 0 and self.quest_ids[i - 1] == self.quest_ids[i] else []
+            for i in range(len(self))
+        ]
+        for quest, first in first_nodes:
+            for requested_id in quest.requested_quests:
+                if requested_id in last_node and requested_id != quest.idx:
+                    self.preds[first].append(last_node[requested_id])
+        self.succs: List[List[int]] = [[] for _ in range(len(self))]
+        for node, preds in enumerate(self.preds):
+            for pred in preds:
+                self.succs[pred].append(node)
+
+        self.zone_ids = sorted({obj.sub_area for obj in self.objectives} - {NO_ZONE})
+        zone_index = {zone_id: i for i, zone_id in enumerate(self.zone_ids)}
+        zone_index[NO_ZONE] = len(self.zone_ids)
+        self.zones = np.array(
+            [zone_index[obj.sub_area] for obj in self.objectives], dtype=np.int64
+        )
+
+        # one more zone for -1, its row and column stay at 0
+        n_zones = len(self.zone_ids) + 1
+        self.dist = np.zeros((n_zones, n_zones), dtype=np.int64)
+        self.dist[:-1, :-1] = (
+            dist_mat.loc[self.zone_ids, self.zone_ids].to_numpy().astype(np.int64)
+        )
+        # as in plan.lp the start cost only exists when 250 is one of the zones
+        self.start = np.zeros(n_zones, dtype=np.int64)
+        if START_ZONE in zone_index:
+            self.start[:] = self.dist[zone_index[START_ZONE]]
+
+    def __len__(self) -> int:
+        return len(self.objectives)
+
+    def cost(self, order: List[int]) -> int:
+        """Cost of the path visiting the nodes in the given order"""
+        if len(order) == 0:
+            return 0
+        zones = self.zones[np.asarray(order)]
+        return int(self.start[zones[0]] + self.dist[zones[:-1], zones[1:]].sum())
+
+    def is_valid(self, order: List[int]) -> bool:
+        if sorted(order) != list(range(len(self))):
+            return False
+        pos = np.empty(len(self), dtype=np.int64)
+        pos[np.asarray(order, dtype=np.int64)] = np.arange(len(order))
+        return all(
+            pos[pred] < pos[node]
+            for node in range(len(self))
+            for pred in self.preds[node]
+        )
+
+    def to_path(self, order: List[int]) -> Dict[int, mod.Objective]:
+        """Same {step: objective} dictionary as gen_clingo.asp_plan"""
+        return {step: self.objectives[node] for step, node in enumerate(order)}
+
+
+def greedy_order(problem: PlanProblem) -> List[int]:
+    """Topological order always going to the nearest available zone"""
+    remaining = np.array([len(preds) for preds in problem.preds], dtype=np.int64)
+    available = np.zeros(len(problem), dtype=bool)
+    available[remaining == 0] = True
+    order = []
+    costs = problem.start
+    while len(order) < len(problem):
+        candidates = np.flatnonzero(available)
+        node = int(candidates[np.argmin(costs[problem.zones[candidates]])])
+        order.append(node)
+        available[node] = False
+        for succ in problem.succs[node]:
+            remaining[succ] -= 1
+            if remaining[succ] == 0:
+                available[succ] = True
+        costs = problem.dist[problem.zones[node]]
+    return order
+
+
+def or_opt(
+    problem: PlanProblem,
+    order: List[int],
+    max_segment: int = 3,
+    max_passes: int = 20,
+    time_limit: float | None = None,
+) -> List[int]:
+    """Improve an order by moving segments of up to max_segment consecutive
+    nodes elsewhere in the path, without breaking any precedence"""
+    n_nodes = len(order)
+    if n_nodes < 2:
+        return list(order)
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    # extended zone matrix: index -2 is the start, index -1 the end of the path
+    n_zones = len(problem.dist)
+    dist = np.zeros((n_zones + 2, n_zones + 2), dtype=np.int64)
+    dist[:n_zones, :n_zones] = problem.dist
+    dist[n_zones, :n_zones] = problem.start
+    start_zone, end_zone = n_zones, n_zones + 1
+
+    order = np.asarray(order, dtype=np.int64)
+    pos = np.empty(n_nodes, dtype=np.int64)
+    for _ in range(max_passes):
+        improved = False
+        moved = True
+        i = 0
+        while i < n_nodes:
+            if deadline is not None and time.monotonic() > deadline:
+                return order.tolist()
+            if moved:
+                pos[order] = np.arange(n_nodes)
+                ext = np.concatenate(([start_zone], problem.zones[order], [end_zone]))
+                moved = False
+            best = None
+            for length in range(1, min(max_segment, n_nodes - i) + 1):
+                move = best_move(problem, dist, ext, order, pos, i, length)
+                if move is not None and (best is None or move[0] < best[0]):
+                    best = (move[0], length, move[1])
+            if best is not None and best[0] < 0:
+                order = apply_move(order, i, best[1], best[2])
+                improved = moved = True
+            else:
+                i += 1
+        if not improved:
+            break
+    return order.tolist()
+
+
+def best_move(
+    problem: PlanProblem,
+    dist: np.ndarray,
+    ext: np.ndarray,
+    order: np.ndarray,
+    pos: np.ndarray,
+    i: int,
+    length: int,
+) -> Tuple[int, int] | None:
+    """Best (cost delta, edge) to move the segment order[i:i + length] to, the
+    segment is inserted between ext[edge] and ext[edge + 1]"""
+    segment = order[i : i + length]
+    pred_max = max(
+        (pos[pred] for node in segment for pred in problem.preds[node] if pos[pred] < i),
+        default=-1,
+    )
+    succ_min = min(
+        (
+            pos[succ]
+            for node in segment
+            for succ in problem.succs[node]
+            if pos[succ] >= i + length
+        ),
+        default=len(order),
+    )
+    # positions in ext are shifted by one because of the start
+    first, last = i + 1, i + length
+    gain = (
+        dist[ext[first - 1], ext[first]]
+        + dist[ext[last], ext[last + 1]]
+        - dist[ext[first - 1], ext[last + 1]]
+    )
+    edges = np.concatenate(
+        (np.arange(pred_max + 1, first - 1), np.arange(last + 1, succ_min + 1))
+    )
+    if len(edges) == 0:
+        return None
+    deltas = (
+        dist[ext[edges], ext[first]]
+        + dist[ext[last], ext[edges + 1]]
+        - dist[ext[edges], ext[edges + 1]]
+        - gain
+    )
+    best = int(np.argmin(deltas))
+    return int(deltas[best]), int(edges[best])
+
+
+def apply_move(order: np.ndarray, i: int, length: int, edge: int) -> np.ndarray:
+    """Move order[i:i + length] after order[edge - 1] (after the start when edge is 0)"""
+    segment = order[i : i + length]
+    if edge < i:
+        return np.concatenate((order[:edge], segment, order[edge:i], order[i + length :]))
+    return np.concatenate((order[:i], order[i + length : edge], segment, order[edge:]))
+
+
+def exact_order(problem: PlanProblem, max_states: int = 2_000_000) -> Tuple[List[int], int]:
+    """Optimal order and its cost by dynamic programming.
+
+    Objectives of a quest are done in order, so a set of done objectives is
+    the number of objectives done in each quest. The states of a layer have
+    the same number of done objectives and only keep the cheapest way to
+    reach a (progress, last zone) pair. Raises ValueError past max_states.
+    """
+    chains: Dict[int, List[int]] = {}
+    for node, quest_id in enumerate(problem.quest_ids):
+        chains.setdefault(quest_id, []).append(node)
+    chains_list = list(chains.values())
+    chain_of = np.empty(len(problem), dtype=np.int64)
+    rank_of = np.empty(len(problem), dtype=np.int64)
+    for chain_idx, chain in enumerate(chains_list):
+        chain_of[chain] = chain_idx
+        rank_of[chain] = np.arange(len(chain))
+
+    start_key = (tuple([0] * len(chains_list)), -1)
+    layer = {start_key: (0, None, None)}
+    layers = [layer]
+    n_states = 1
+    for _ in range(len(problem)):
+        next_layer = {}
+        for key, (cost, _, _) in layer.items():
+            progress, last_zone = key
+            for chain_idx, chain in enumerate(chains_list):
+                if progress[chain_idx] == len(chain):
+                    continue
+                node = chain[progress[chain_idx]]
+                if any(
+                    progress[chain_of[pred]] <= rank_of[pred]
+                    for pred in problem.preds[node]
+                ):
+                    continue
+                zone = problem.zones[node]
+                step_cost = (
+                    problem.start[zone]
+                    if last_zone == -1
+                    else problem.dist[last_zone, zone]
+                )
+                next_progress = list(progress)
+                next_progress[chain_idx] += 1
+                next_key = (tuple(next_progress), int(zone))
+                next_cost = cost + int(step_cost)
+                if next_key not in next_layer or next_cost < next_layer[next_key][0]:
+                    next_layer[next_key] = (next_cost, key, node)
+        n_states += len(next_layer)
+        if n_states > max_states:
+            raise ValueError(f"more than {max_states} states to explore")
+        if len(next_layer) == 0:
+            raise ValueError("the quest precedence graph has a cycle")
+        layers.append(next_layer)
+        layer = next_layer
+
+    key = min(layer, key=lambda key: layer[key][0])
+    best_cost = layer[key][0]
+    order = []
+    for step_layer in reversed(layers[1:]):
+        _, key, node = step_layer[key]
+        order.append(node)
+    order.reverse()
+    return order, best_cost
+
+
+def exact_plan(
+    quests: Dict[int, mod.Quest], dist_mat: pd.DataFrame, max_states: int = 2_000_000
+) -> Tuple[Dict[int, mod.Objective], int]:
+    """Optimal path and its cost, for small quest sets"""
+    problem = PlanProblem(quests, dist_mat)
+    order, cost = exact_order(problem, max_states)
+    return problem.to_path(order), cost
+
+
+def heuristic_plan(
+    quests: Dict[int, mod.Quest],
+    dist_mat: pd.DataFrame,
+    max_segment: int = 3,
+    max_passes: int = 20,
+    time_limit: float | None = None,
+) -> Tuple[Dict[int, mod.Objective], int]:
+    """Path and its cost, greedy nearest zone path improved by or-opt moves,
+    no optimality guarantee"""
+    problem = PlanProblem(quests, dist_mat)
+    order = greedy_order(problem)
+    order = or_opt(problem, order, max_segment, max_passes, time_limit)
+    return problem.to_path(order), problem.cost(order)
+
+
+def zone_distance(dist_mat: pd.DataFrame, from_zone: int, to_zone: int) -> int:
+    if from_zone == NO_ZONE or to_zone == NO_ZONE:
+        return 0
+    return int(dist_mat.loc[from_zone, to_zone])
+
+
+def order_components(
+    paths: Sequence[Dict[int, mod.Objective]],
+    dist_mat: pd.DataFrame,
+    exact_limit: int = 12,
+) -> List[int]:
+    """Order in which independent paths should be concatenated: the cost of
+    going from the last zone of a path to the first zone of the next one is
+    minimized exactly (dynamic programming over subsets) up to exact_limit
+    paths, greedily past it"""
+    firsts = [path[min(path)].sub_area for path in paths]
+    lasts = [path[max(path)].sub_area for path in paths]
+    with_start = any(
+        obj.sub_area == START_ZONE for path in paths for obj in path.values()
+    )
+    start = [
+        zone_distance(dist_mat, START_ZONE, first) if with_start else 0
+        for first in firsts
+    ]
+    link = [[zone_distance(dist_mat, last, first) for first in firsts] for last in lasts]
+
+    n_paths = len(paths)
+    if n_paths > exact_limit:
+        remaining = set(range(n_paths))
+        current = min(remaining, key=lambda i: start[i])
+        order = [current]
+        remaining.remove(current)
+        while len(remaining) > 0:
+            current = min(remaining, key=lambda i: link[order[-1]][i])
+            order.append(current)
+            remaining.remove(current)
+        return order
+
+    # best[(subset, last)]: cheapest cost of doing the paths of subset ending with last
+    best = {(1 << i, i): (start[i], None) for i in range(n_paths)}
+    for size in range(2, n_paths + 1):
+        for subset_paths in itertools.combinations(range(n_paths), size):
+            subset = sum(1 << i for i in subset_paths)
+            for last in subset_paths:
+                previous = subset & ~(1 << last)
+                best[(subset, last)] = min(
+                    (best[(previous, before)][0] + link[before][last], before)
+                    for before in subset_paths
+                    if before != last
+                )
+    subset = (1 << n_paths) - 1
+    last = min(range(n_paths), key=lambda i: best[(subset, i)][0])
+    order = []
+    while last is not None:
+        order.append(last)
+        subset, last = subset & ~(1 << last), best[(subset, last)][1]
+    order.reverse()
+    return order
@@ -0,0 +1,201 @@
+"""Array backed precedence graph of a quest dictionary"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Set
+import numpy as np
+import dofusdb.model as mod
+import dofusdb.instrument as instrument
+
+
+def gather_neighbors(
+    indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray
+) -> np.ndarray:
+    """Concatenation of the CSR rows of every node"""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0, dtype=indices.dtype)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return indices[offsets + np.arange(total)]
+
+
+def to_csr(src: np.ndarray, dst: np.ndarray, n_nodes: int):
+    """CSR arrays (indptr, indices) of the edges src -> dst"""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, dst[order]
+
+
+class QuestGraph:
+    """Precedence graph between quests, built once from a quest dictionary.
+
+    Quests are mapped to dense indexes (``ids[i]`` is the quest of index i,
+    ``index[quest_id]`` the reverse). Edges go from a quest to the quests it
+    requires (predecessors) and are stored twice in CSR form:
+    ``pred_indices[pred_indptr[i]:pred_indptr[i + 1]]`` are the prerequisites of
+    quest i and ``succ_indices[succ_indptr[i]:succ_indptr[i + 1]]`` the quests
+    requiring it. Prerequisites missing from the dictionary are kept in
+    ``missing``.
+    """
+
+    @instrument.timed("quest_graph.build")
+    def __init__(self, quests_dict: Dict[int, mod.Quest]) -> None:
+        self.ids = np.fromiter(quests_dict.keys(), dtype=np.int64, count=len(quests_dict))
+        self.index = {quest_id: i for i, quest_id in enumerate(quests_dict)}
+        self.missing: Dict[int, Set[int]] = {}
+
+        src, dst = [], []
+        for i, quest in enumerate(quests_dict.values()):
+            for requested_id in quest.requested_quests:
+                if requested_id in self.index:
+                    if requested_id != quest.idx:
+                        src.append(i)
+                        dst.append(self.index[requested_id])
+                else:
+                    self.missing.setdefault(quest.idx, set()).add(requested_id)
+        src = np.array(src, dtype=np.int64)
+        dst = np.array(dst, dtype=np.int64)
+
+        self.pred_indptr, self.pred_indices = to_csr(src, dst, len(self))
+        self.succ_indptr, self.succ_indices = to_csr(dst, src, len(self))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.pred_indices)
+
+    def in_degree(self) -> np.ndarray:
+        """Number of prerequisites of each quest"""
+        return np.diff(self.pred_indptr)
+
+    def out_degree(self) -> np.ndarray:
+        """Number of quests requiring each quest"""
+        return np.diff(self.succ_indptr)
+
+    def predecessors(self, quest_id: int) -> np.ndarray:
+        i = self.index[quest_id]
+        return self.ids[self.pred_indices[self.pred_indptr[i] : self.pred_indptr[i + 1]]]
+
+    def successors(self, quest_id: int) -> np.ndarray:
+        i = self.index[quest_id]
+        return self.ids[self.succ_indices[self.succ_indptr[i] : self.succ_indptr[i + 1]]]
+
+    @instrument.timed("quest_graph.topological_levels")
+    def topological_levels(self) -> List[np.ndarray]:
+        """Indexes grouped by level: a quest only requires quests of lower levels"""
+        remaining = self.in_degree().copy()
+        frontier = np.flatnonzero(remaining == 0)
+        levels = []
+        visited = 0
+        while len(frontier) > 0:
+            levels.append(frontier)
+            visited += len(frontier)
+            successors = gather_neighbors(self.succ_indptr, self.succ_indices, frontier)
+            remaining -= np.bincount(successors, minlength=len(self))
+            candidates = np.unique(successors)
+            frontier = candidates[remaining[candidates] == 0]
+        if visited != len(self):
+            raise ValueError("the quest precedence graph has a cycle")
+        return levels
+
+    def topological_order(self) -> np.ndarray:
+        """Indexes sorted so that every quest comes after its prerequisites"""
+        levels = self.topological_levels()
+        if len(levels) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(levels)
+
+    @instrument.timed("quest_graph.reachable")
+    def reachable(
+        self, sources: Iterable[int], indptr: np.ndarray, indices: np.ndarray
+    ) -> np.ndarray:
+        """Mask of the indexes reachable from the sources indexes (sources excluded)"""
+        seen = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(np.fromiter(sources, dtype=np.int64))
+        while len(frontier) > 0:
+            neighbors = gather_neighbors(indptr, indices, frontier)
+            neighbors = np.unique(neighbors[~seen[neighbors]])
+            seen[neighbors] = True
+            frontier = neighbors
+        return seen
+
+    def ancestors(self, quest_ids: int | Iterable[int]) -> Set[int]:
+        """Every quest required, directly or not, by the given quest(s)"""
+        sources = [quest_ids] if isinstance(quest_ids, (int, np.integer)) else quest_ids
+        mask = self.reachable(
+            (self.index[q] for q in sources), self.pred_indptr, self.pred_indices
+        )
+        return set(self.ids[mask].tolist())
+
+    def descendants(self, quest_ids: int | Iterable[int]) -> Set[int]:
+        """Every quest requiring, directly or not, the given quest(s)"""
+        sources = [quest_ids] if isinstance(quest_ids, (int, np.integer)) else quest_ids
+        mask = self.reachable(
+            (self.index[q] for q in sources), self.succ_indptr, self.succ_indices
+        )
+        return set(self.ids[mask].tolist())
+
+    @instrument.timed("quest_graph.weakly_connected_components")
+    def weakly_connected_components(self) -> List[List[int]]:
+        """Quest ids grouped by component, ignoring the direction of the edges"""
+        src = np.repeat(np.arange(len(self)), self.in_degree())
+        dst = self.pred_indices
+        labels = np.arange(len(self))
+        while True:
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, src, labels[dst])
+            np.minimum.at(new_labels, dst, labels[src])
+            new_labels = new_labels[new_labels]
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+        _, inverse = np.unique(labels, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        splits = np.flatnonzero(np.diff(inverse[order])) + 1
+        return [self.ids[group].tolist() for group in np.split(order, splits)]
+
+    @instrument.timed("quest_graph.redundant_edges")
+    def redundant_edges(self) -> List[tuple[int, int]]:
+        """Edges (quest_id, requested_id) implied by another path (transitive reduction).
+
+        Quests are visited in topological order while keeping, for each quest, the
+        bitset of its ancestors (one bit per quest, packed in uint64 words), so the
+        whole reduction costs O(V * E / 64).
+        """
+        words = (len(self) + 63) // 64
+        ancestors = np.zeros((len(self), words), dtype=np.uint64)
+        own_bit = np.zeros((len(self), words), dtype=np.uint64)
+        all_indexes = np.arange(len(self))
+        own_bit[all_indexes, all_indexes >> 6] = np.left_shift(
+            np.uint64(1), (all_indexes & 63).astype(np.uint64)
+        )
+
+        redundant = []
+        for level in self.topological_levels():
+            counts = self.pred_indptr[level + 1] - self.pred_indptr[level]
+            nodes = level[counts > 0]
+            if len(nodes) == 0:
+                continue
+            counts = counts[counts > 0]
+            preds = gather_neighbors(self.pred_indptr, self.pred_indices, nodes)
+            starts = np.cumsum(counts) - counts
+
+            # a requested quest is redundant if it is an ancestor of another requested quest
+            preds_ancestors = np.bitwise_or.reduceat(ancestors[preds], starts, axis=0)
+            edge_nodes = np.repeat(np.arange(len(nodes)), counts)
+            implied = (
+                preds_ancestors[edge_nodes, preds >> 6]
+                >> (preds & 63).astype(np.uint64)
+            ) & np.uint64(1)
+            for node, pred in zip(nodes[edge_nodes[implied == 1]], preds[implied == 1]):
+                redundant.append((int(self.ids[node]), int(self.ids[pred])))
+
+            ancestors[nodes] = preds_ancestors | np.bitwise_or.reduceat(
+                own_bit[preds], starts, axis=0
+            )
+        return redundant
@@ -1,24 +1,48 @@
 import dofusdb.model as mod
+import dofusdb.instrument as instrument
 
-from typing import Dict
+from typing import Dict, Iterable, List, Tuple
+import hashlib
 import json
+import re
 import sqlite3
 
+QUEST_COLUMNS = 'id, "name.fr", startCriterion, categoryId'
+OBJECTIVE_COLUMNS = [
+    '"index"',
+    "typeId",
+    "text",
+    "subAreaId",
+    "questId",
+    '"parameters.parameter0"',
+    '"parameters.parameter1"',
+    '"parameters.parameter2"',
+    '"parameters.parameter3"',
+    '"parameters.parameter4"',
+]
+
 
 class database:
     def __init__(self, path):
+        self.path = path
         self.conn = sqlite3.connect(path)
+        self.following = None
+
+    def execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        with instrument.timer("sql.statement"):
+            return self.conn.execute(sql, params)
 
+    @instrument.timed("sql_loader.load_all_subarea")
     def load_all_subarea(self) -> Dict[str, mod.SubArea]:
         subarea_dict = {}
 
-        curr = self.conn.execute(
+        curr = self.execute(
             'SELECT id, "name.fr", mapIds, "bounds.x", "bounds.y", "bounds.width", "bounds.height", worldmapId FROM subareas'
         )
 
         for subarea_sql in curr:
             subarea = mod.sub_area_from_sql(subarea_sql)
-            maps = self.conn.execute(
+            maps = self.execute(
                 f"SELECT * FROM maps where subAreaId={subarea.idx}"
             )
             for map_row in maps:
@@ -26,27 +50,105 @@ class database:
             subarea_dict[subarea.name] = subarea
         return subarea_dict
 
+    @instrument.timed("sql_loader.tables_checksum")
+    def tables_checksum(self, tables: Iterable[str]) -> str:
+        """Checksum of the content of some tables, change when the tables are rebuilt"""
+        checksum = hashlib.sha1()
+        for table in tables:
+            checksum.update(table.encode())
+            for row in self.execute(f'SELECT * FROM "{table}" ORDER BY rowid'):
+                checksum.update(repr(row).encode())
+        return checksum.hexdigest()
+
+    @instrument.timed("sql_loader.load_all_quest")
     def load_all_quest(self) -> Dict[int, mod.Quest]:
-        quests_req = self.conn.execute(
-            'SELECT id, "name.fr", startCriterion, categoryId FROM quests'
+        quests_req = self.execute(f"SELECT {QUEST_COLUMNS} FROM quests")
+        obj_req = self.execute(
+            f"SELECT {', '.join(OBJECTIVE_COLUMNS)} FROM objectives ORDER BY rowid"
         )
-        return self.load_quest_from_req(quests_req)
+        return self.build_quests(quests_req, group_objectives(obj_req))
 
+    @instrument.timed("sql_loader.load_quest_from_category")
     def load_quest_from_category(self, category_id: int) -> Dict[int, mod.Quest]:
-        quests_req = self.conn.execute(
-            f'SELECT id, "name.fr", startCriterion, categoryId FROM quests WHERE categoryId={category_id}'
+        quests_req = self.execute(
+            f"SELECT {QUEST_COLUMNS} FROM quests WHERE categoryId=?", (category_id,)
+        )
+        obj_req = self.execute(
+            f"SELECT {', '.join('o.' + col for col in OBJECTIVE_COLUMNS)} "
+            "FROM objectives o JOIN quests q ON o.questId = q.id "
+            "WHERE q.categoryId=? ORDER BY o.rowid",
+            (category_id,),
         )
+        return self.build_quests(quests_req, group_objectives(obj_req))
+
+    @instrument.timed("sql_loader.load_quests")
+    def load_quests(
+        self, quest_ids: Iterable[int], lang: str = "fr", chunk_size: int = 500
+    ) -> Dict[int, mod.Quest]:
+        """Load many quests by id (only french names are stored)"""
+        quest_ids = list(dict.fromkeys(quest_ids))
+        quests_dict = {}
+        for start in range(0, len(quest_ids), chunk_size):
+            chunk = quest_ids[start : start + chunk_size]
+            quests_req = self.execute(
+                f"SELECT {QUEST_COLUMNS} FROM quests WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            quests_dict.update(self.load_quest_from_req(quests_req))
+        return quests_dict
+
+    def load_quest(self, quest_id: int, lang: str = "fr") -> mod.Quest:
+        return self.load_quests([quest_id], lang)[quest_id]
 
-        return self.load_quest_from_req(quests_req)
+    @instrument.timed("sql_loader.load_following_ids")
+    def load_following_ids(self, quest_id: int) -> List[int]:
+        """Ids of the quests having the provided one in their start criterion,
+        the reverse index is built on first use"""
+        if self.following is None:
+            self.following = {}
+            for idx, criterion in self.execute("SELECT id, startCriterion FROM quests"):
+                for requested_id in set(re.findall(r"Qf=(\d+)", criterion or "")):
+                    self.following.setdefault(int(requested_id), []).append(idx)
+        return self.following.get(quest_id, [])
 
     def load_quest_from_req(self, quests_req: sqlite3.Cursor) -> Dict[int, mod.Quest]:
-        quests_dict = {}
+        """Build quests from an already executed request on the quests table"""
+        quests_rows = quests_req.fetchall()
+        objectives = self.load_objectives([quest[0] for quest in quests_rows])
+        return self.build_quests(quests_rows, objectives)
 
-        for quest in quests_req:
-            obj_req = self.conn.execute(
-                f'SELECT "index", typeId, text, subAreaId, questId, "parameters.parameter0", "parameters.parameter1", "parameters.parameter2", "parameters.parameter3", "parameters.parameter4" FROM objectives WHERE questId={quest[0]}'
+    @instrument.timed("sql_loader.load_objectives")
+    def load_objectives(
+        self, quest_ids: Iterable[int], chunk_size: int = 500
+    ) -> Dict[int, List[Tuple]]:
+        """Load the objective rows of many quests, grouped by quest id"""
+        quest_ids = list(dict.fromkeys(quest_ids))
+        objectives = {}
+        for start in range(0, len(quest_ids), chunk_size):
+            chunk = quest_ids[start : start + chunk_size]
+            obj_req = self.execute(
+                f"SELECT {', '.join(OBJECTIVE_COLUMNS)} FROM objectives "
+                f"WHERE questId IN ({', '.join('?' * len(chunk))}) ORDER BY rowid",
+                chunk,
             )
+            for quest_id, rows in group_objectives(obj_req).items():
+                objectives[quest_id] = rows
+        return objectives
+
+    def build_quests(
+        self, quests_rows: Iterable[Tuple], objectives: Dict[int, List[Tuple]]
+    ) -> Dict[int, mod.Quest]:
+        quests_dict = {}
+        for quest in quests_rows:
             quests_dict[quest[0]] = mod.quest_from_sql(
-                quest, mod.objective_from_sql(obj_req)
+                quest, mod.objective_from_sql(objectives.get(quest[0], []))
             )
         return quests_dict
+
+
+def group_objectives(obj_req: Iterable[Tuple]) -> Dict[int, List[Tuple]]:
+    """Group objective rows by quest id, keeping the table order inside a quest"""
+    objectives = {}
+    for objective in obj_req:
+        objectives.setdefault(objective[4], []).append(objective)
+    return objectives
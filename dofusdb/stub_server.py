@@ -0,0 +1,354 @@
+"""Local stand-in of the DofusDB API, to test and benchmark the loaders offline.
+
+The data comes from DDB-Downloader json exports or from the sqlite base::
+
+    with StubServer(data_from_sqlite("dofusdb.sqlite"), latency=0.05) as server:
+        api_loader.API_URL = server.url
+        quests = api_loader.load_quest_from_category(19)
+
+or from the command line: ``python -m dofusdb.stub_server --sqlite dofusdb.sqlite``.
+
+``/quests``, ``/achievements``, ``/subareas`` and ``/map-positions`` are
+served as lists (``$skip``, ``$limit``, ``$select[]``, ``field=value``,
+``field[$regex]=...``, ``field[$in][]=...``) and by id. Latency, rate
+limits (429) and random failures (503) can be injected.
+"""
+
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+COLLECTIONS = ("quests", "achievements", "subareas", "map-positions")
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def data_from_exports(folder: str) -> Dict[str, Dict[int, Any]]:
+    """Collections of the DDB-Downloader exports found in folder, quests
+    without steps get them from quest-steps.json and quest-objectives.json"""
+
+    def load(name: str) -> List[Any]:
+        path = os.path.join(folder, f"{name}.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as file:
+            content = json.load(file)
+        return content["data"] if isinstance(content, dict) else content
+
+    data = {name: {el["id"]: el for el in load(name)} for name in COLLECTIONS}
+    objectives = {el["id"]: el for el in load("quest-objectives")}
+    steps = {}
+    for step in load("quest-steps"):
+        steps.setdefault(step["questId"], []).append(
+            {
+                **step,
+                "objectives": [
+                    objectives[obj_id]
+                    for obj_id in step.get("objectiveIds", [])
+                    if obj_id in objectives
+                ],
+            }
+        )
+    for quest in data["quests"].values():
+        if "steps" not in quest:
+            quest["steps"] = steps.get(quest["id"], [])
+    return data
+
+
+def data_from_sqlite(path: str) -> Dict[str, Dict[int, Any]]:
+    """Collections rebuilt from the tables of the sqlite base (no achievements)"""
+    conn = sqlite3.connect(path)
+    data = {name: {} for name in COLLECTIONS}
+    for idx, pos_x, pos_y, subarea_id, world_map in conn.execute(
+        "SELECT id, posX, posY, subAreaId, worldMap FROM maps"
+    ):
+        data["map-positions"][idx] = {
+            "id": idx,
+            "posX": pos_x,
+            "posY": pos_y,
+            "subAreaId": subarea_id,
+            "worldMap": world_map,
+        }
+    for idx, name, map_ids, x, y, width, height, world_map in conn.execute(
+        'SELECT id, "name.fr", mapIds, "bounds.x", "bounds.y", "bounds.width", '
+        '"bounds.height", worldmapId FROM subareas'
+    ):
+        data["subareas"][idx] = {
+            "id": idx,
+            "name": {"fr": name},
+            "mapIds": json.loads(map_ids),
+            "bounds": {"x": x, "y": y, "width": width, "height": height},
+            "worldmapId": world_map,
+        }
+
+    steps = {}
+    for row in conn.execute(
+        'SELECT "index", typeId, text, subAreaId, questId, "parameters.parameter0", '
+        '"parameters.parameter1", "parameters.parameter2", "parameters.parameter3", '
+        '"parameters.parameter4" FROM objectives ORDER BY rowid'
+    ):
+        objective = {
+            "id": row[0],
+            "typeId": row[1],
+            "text": [row[2]],
+            "parameters": {f"parameter{i}": param for i, param in enumerate(row[5:])},
+            "map": {"subAreaId": row[3]},
+        }
+        steps.setdefault(row[4], []).append(objective)
+    for idx, name, criterion, category_id in conn.execute(
+        'SELECT id, "name.fr", startCriterion, categoryId FROM quests'
+    ):
+        data["quests"][idx] = {
+            "id": idx,
+            "name": {"fr": name},
+            "startCriterion": criterion,
+            "categoryId": category_id,
+            "steps": [{"objectives": steps.get(idx, [])}],
+        }
+    conn.close()
+    return data
+
+
+def matcher(expected: List[str]) -> Callable[[Any], bool]:
+    """Test of a json value against query string values, converted once"""
+    strings = set(expected)
+    booleans = {value.lower() for value in expected}
+    numbers = set()
+    for value in expected:
+        try:
+            numbers.add(float(value))
+        except ValueError:
+            pass
+
+    def test(value: Any) -> bool:
+        if isinstance(value, bool):
+            return str(value).lower() in booleans
+        if isinstance(value, (int, float)):
+            return value in numbers
+        return str(value) in strings
+
+    return test
+
+
+def select(element: Any, fields: List[str]) -> Any:
+    if len(fields) == 0:
+        return element
+    return {key: element[key] for key in ["id", *fields] if key in element}
+
+
+class StubServer:
+    """Threaded http server on data (collection name -> id -> json element).
+
+    latency (+ up to jitter) seconds are waited before each answer,
+    failure_rate of the requests get a 503 and past rate_limit requests per
+    second the answer is a 429. stats holds the number of requests, of
+    injected errors and the highest number of requests handled at once.
+    """
+
+    def __init__(
+        self,
+        data: Dict[str, Dict[int, Any]],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        rate_limit: float | None = None,
+        max_limit: int = MAX_LIMIT,
+        seed: int | None = None,
+    ) -> None:
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rate_limit = rate_limit
+        self.max_limit = max_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "rate_limited": 0, "max_in_flight": 0}
+        self.in_flight = 0
+        self.tokens = rate_limit or 0.0
+        self.last_refill = time.monotonic()
+
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> StubServer:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> StubServer:
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def take_token(self) -> bool:
+        """Token bucket of rate_limit requests per second"""
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        self.tokens = min(
+            self.rate_limit, self.tokens + (now - self.last_refill) * self.rate_limit
+        )
+        self.last_refill = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def answer(self, path: str) -> tuple[int, Any]:
+        """Status and json body of a GET request"""
+        with self.lock:
+            self.stats["requests"] += 1
+            if not self.take_token():
+                self.stats["rate_limited"] += 1
+                return 429, {"message": "Too many requests"}
+            if self.random.random() < self.failure_rate:
+                self.stats["failures"] += 1
+                return 503, {"message": "Injected failure"}
+            delay = self.latency + self.random.random() * self.jitter
+        if delay > 0:
+            time.sleep(delay)
+
+        parts = urlsplit(path)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        if len(segments) == 0 or segments[0] not in self.data:
+            return 404, {"message": f"Unknown path {parts.path}"}
+        collection = self.data[segments[0]]
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        fields = [value for key, value in query if key == "$select[]"]
+
+        if len(segments) == 2:
+            try:
+                element = collection.get(int(segments[1]))
+            except ValueError:
+                element = None
+            if element is None:
+                return 404, {"message": f"No record found for id '{segments[1]}'"}
+            return 200, select(element, fields)
+        return 200, self.find(collection, query, fields)
+
+    def find(self, collection: Dict[int, Any], query: List, fields: List[str]) -> Any:
+        skip, limit = 0, DEFAULT_LIMIT
+        in_filters, filters = {}, []
+        for key, value in query:
+            if key == "$skip":
+                skip = int(value)
+            elif key == "$limit":
+                limit = min(int(value), self.max_limit)
+            elif key.endswith("[$in][]"):
+                in_filters.setdefault(key[: -len("[$in][]")], []).append(value)
+            elif key.endswith("[$regex]"):
+                regex = re.compile(value)
+                filters.append(
+                    lambda el, field=key[: -len("[$regex]")], regex=regex: regex.search(
+                        str(el.get(field, ""))
+                    )
+                    is not None
+                )
+            elif not key.startswith("$") and key != "lang":
+                test = matcher([value])
+                filters.append(lambda el, field=key, test=test: test(el.get(field)))
+
+        candidates = collection.values()
+        if "id" in in_filters:
+            # collections are indexed by id, no need to scan them
+            ids = []
+            for value in in_filters.pop("id"):
+                try:
+                    ids.append(int(value))
+                except ValueError:
+                    pass
+            candidates = [collection[idx] for idx in dict.fromkeys(ids) if idx in collection]
+        for field, values in in_filters.items():
+            test = matcher(values)
+            filters.append(lambda el, field=field, test=test: test(el.get(field)))
+
+        found = [el for el in candidates if all(test(el) for test in filters)]
+        return {
+            "total": len(found),
+            "limit": limit,
+            "skip": skip,
+            "data": [select(el, fields) for el in found[skip : skip + limit]],
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.in_flight += 1
+            stub.stats["max_in_flight"] = max(stub.stats["max_in_flight"], stub.in_flight)
+        try:
+            status, body = stub.answer(self.path)
+        finally:
+            with stub.lock:
+                stub.in_flight -= 1
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in of the DofusDB API")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--sqlite", help="sqlite base built by create_db.ipynb")
+    source.add_argument("--exports", help="folder of DDB-Downloader json exports")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    args = parser.parse_args()
+
+    data = data_from_sqlite(args.sqlite) if args.sqlite else data_from_exports(args.exports)
+    server = StubServer(
+        data,
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        rate_limit=args.rate_limit,
+    )
+    print(f"serving on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
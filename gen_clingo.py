@@ -1,118 +1,517 @@
 """Module pour créer le code ASP et executer clingo"""
-from typing import List, Dict
+from typing import Any, List, Dict, Tuple
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from collections import Counter
 import clingo
 import pandas as pd
 import dofusdb.sql_loader as loader
 import dofusdb.dist_func as dist
+import dofusdb.dist_cache as dist_cache
 import dofusdb.model as mod
 import dofusdb.graph_creator as grapher
-import itertools
+import dofusdb.planner as planner
+from dofusdb.quest_graph import QuestGraph
 import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import sys
+import time
 from json import JSONEncoder
 
 db = loader.database("dofusdb.sqlite")
+PORTFOLIO_FILE = "portfolio.port"
+
+
+@dataclass
+class PlanResult:
+    """Paths found by a planner, the cost of the best one, whether it is
+    proven optimal, the best known lower bound of the optimal cost and the
+    telemetry of the run (see solve_plans)"""
+
+    paths: List[Dict[int, mod.Objective]]
+    cost: int | None
+    optimal: bool
+    lower_bound: int | None
+    report: Dict[str, Any] = field(default_factory=dict)
 
 
 def compute_dist() -> pd.DataFrame:
-    subarea_dict_sql = db.load_all_subarea()
-    dist_all = dist.compute_distance_df(
-        subarea_dict_sql, dist.grav_to_grav_eucl, is_sym=True, index_id=True
+    dist_all = dist_cache.cached_distance_df(
+        db, dist.grav_to_grav_eucl, is_sym=True, index_id=True
     )
     return dist_all
 
 
-def get_zones(quests: Dict[int, mod.Quest]) -> str:
+def get_zones(quests: Dict[int, mod.Quest]) -> List[clingo.Symbol]:
+    """zone/1 and distance/3 facts of the zones of the quests"""
     dist_mat = compute_dist()
-    dist_asp = ""
     subarea_ids = set()
     for quest in quests.values():
         subarea_ids.update(quest.get_subareas())
     subarea_ids.discard(-1)
+    subarea_ids = sorted(subarea_ids)
+
+    zones = [clingo.Number(zone_id) for zone_id in subarea_ids]
+    facts = [clingo.Function("zone", [zone]) for zone in zones]
+    distances = dist_mat.loc[subarea_ids, subarea_ids].to_numpy().astype(int).tolist()
+    for from_zone, row in zip(zones, distances):
+        for to_zone, value in zip(zones, row):
+            facts.append(
+                clingo.Function("distance", [from_zone, to_zone, clingo.Number(value)])
+            )
+    return facts
+
+
+def objective_runs(
+    quests: Dict[int, mod.Quest]
+) -> Dict[Tuple[int, int], List[mod.Objective]]:
+    """Consecutive objectives of a quest in the same zone, by (quest id, id of
+    the first objective). Chaining them costs nothing so each run is planned as
+    a single step. Runs without zone (-1) are kept apart since -1 is at
+    distance 0 of every zone."""
+    runs = {}
+    for quest in quests.values():
+        run = None
+        for obj in sorted(quest.objectives, key=lambda obj: obj.idx):
+            if run is not None and obj.sub_area == run[-1].sub_area != -1:
+                run.append(obj)
+            else:
+                run = [obj]
+                runs[(quest.idx, obj.idx)] = run
+    return runs
+
 
-    for zones in subarea_ids:
-        dist_asp += f"zone({zones}).\n"
+def step_windows(
+    runs: Dict[Tuple[int, int], List[mod.Objective]], quests: Dict[int, mod.Quest]
+) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    """Earliest and latest step of each run: the runs that must be done before
+    (previous runs of the quest, runs of the required quests) come first, the
+    ones that must be done after come last"""
+    quest_runs = {}
+    for quest_id, _ in runs:
+        quest_runs.setdefault(quest_id, 0)
+        quest_runs[quest_id] += 1
+    # as in the encoding, quests without objective do not link their neighbours
+    graph = QuestGraph({quest_id: quests[quest_id] for quest_id in quest_runs})
 
-    for from_id, to_id in itertools.product(subarea_ids, repeat=2):
-        dist_asp += (
-            f"distance({from_id}, {to_id}, {int(dist_mat.loc[from_id, to_id])}).\n"
+    windows = {}
+    rank = {}
+    spans = {
+        quest_id: (
+            sum(quest_runs[idx] for idx in graph.ancestors(quest_id)),
+            sum(quest_runs[idx] for idx in graph.descendants(quest_id)),
         )
-    return dist_asp
+        for quest_id in quest_runs
+    }
+    for quest_id, obj_id in runs:
+        rank[quest_id] = rank.get(quest_id, -1) + 1
+        before, after = spans[quest_id]
+        windows[(quest_id, obj_id)] = (
+            1 + before + rank[quest_id],
+            len(runs) - after - (quest_runs[quest_id] - 1 - rank[quest_id]),
+        )
+    return windows
 
 
-def get_quests(quests: Dict[int, mod.Quest]) -> Dict[int, mod.Objective]:
-    quest_asp = ""
-    num_obj = 0
+def get_quests(quests: Dict[int, mod.Quest]) -> List[clingo.Symbol]:
+    """quest/1, precond/2, objective/3 and window/4 facts, objectives being
+    grouped in runs"""
+    facts = []
     for quest in quests.values():
-        quest_asp += f"quest({quest.idx}).\n"
+        facts.append(clingo.Function("quest", [clingo.Number(quest.idx)]))
         for req in quest.requested_quests:
-            quest_asp += f"precond({quest.idx}, {req}).\n"
-        for obj in quest.objectives:
-            quest_asp += f"objective({obj.idx}, {quest.idx}, {obj.sub_area}).\n"
-            num_obj += 1
-    quest_asp = f"#const n_step={num_obj}.\n" + quest_asp
-    return quest_asp
+            facts.append(
+                clingo.Function("precond", [clingo.Number(quest.idx), clingo.Number(req)])
+            )
+    runs = objective_runs(quests)
+    windows = step_windows(runs, quests)
+    for (quest_id, obj_id), run in runs.items():
+        obj, quest = clingo.Number(obj_id), clingo.Number(quest_id)
+        facts.append(
+            clingo.Function("objective", [obj, quest, clingo.Number(run[0].sub_area)])
+        )
+        earliest, latest = windows[(quest_id, obj_id)]
+        facts.append(
+            clingo.Function(
+                "window", [obj, quest, clingo.Number(earliest), clingo.Number(latest)]
+            )
+        )
+    return facts
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def solver_options(threads: int | None = None, portfolio: bool = False) -> List[str]:
+    """clingo options, one solver thread per core by default. With portfolio
+    the threads compete with the configurations of portfolio.port (search
+    heuristic, restarts, optimization strategy) and the first one proving
+    the optimum stops the others"""
+    options = ["-n 0", f"-t{threads or available_cores()}"]
+    if portfolio:
+        options.append(f"--configuration={PORTFOLIO_FILE}")
+    return options
 
 
-def asp_plan(quests: Dict[int, mod.Quest]) -> List[Dict[int, mod.Objective]]:
+@contextmanager
+def timed(report: Dict[str, Any], phase: str):
+    """Store the wall time of the block in report["phases"][phase]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.setdefault("phases", {})[phase] = time.perf_counter() - start
+
+
+def fact_counts(facts: List[clingo.Symbol]) -> Dict[str, int]:
+    """Number of facts by predicate"""
+    return dict(Counter(f"{fact.name}/{len(fact.arguments)}" for fact in facts))
+
+
+def solver_statistics(ctl: clingo.Control) -> Dict[str, Any]:
+    """Main figures of ctl.statistics after a solve call"""
+    stats = ctl.statistics
+    summary = stats["summary"]
+    return {
+        "atoms": int(stats["problem"]["lp"]["atoms"]),
+        "rules": int(stats["problem"]["lp"]["rules"]),
+        "choices": int(stats["solving"]["solvers"]["choices"]),
+        "conflicts": int(stats["solving"]["solvers"]["conflicts"]),
+        "models": int(summary["models"]["enumerated"]),
+        "optimal_models": int(summary["models"]["optimal"]),
+        "costs": list(summary.get("costs", [])),
+        "lower": list(summary.get("lower", [])),
+        "times": dict(summary["times"]),
+    }
+
+
+def add_facts(ctl: clingo.Control, facts: List[clingo.Symbol]):
+    """Add facts to the program without going through the parser"""
+    with ctl.backend() as backend:
+        for fact in facts:
+            backend.add_rule([backend.add_atom(fact)])
+
+
+def asp_plan(
+    quests: Dict[int, mod.Quest],
+    output: str | None = None,
+    keep: int | None = None,
+    time_limit: float | None = None,
+    threads: int | None = None,
+    portfolio: bool = False,
+) -> PlanResult:
     """fonction planificateur utilisant ASP"""
 
-    asp_code = ""
-    with open("plan.lp", "r") as file_asp:
-        asp_base = file_asp.readlines()
-        asp_code = convert_to_asp(quests)
+    started = time.perf_counter()
+    report = {"planner": "asp"}
+    n_step = len(objective_runs(quests))
+    with timed(report, "convert_to_asp"):
+        facts = convert_to_asp(quests)
+    report["facts"] = fact_counts(facts)
+    with timed(report, "add"):
+        ctl = clingo.Control(solver_options(threads, portfolio) + [f"-c n_step={n_step}"])
+        ctl.load("plan.lp")
+        add_facts(ctl, facts)
+    with timed(report, "ground"):
+        ctl.ground([("base", [])])
+    return solve_plans(ctl, quests, output, keep, time_limit, report, started)
+
+
+def asp_plan_incremental(
+    quests: Dict[int, mod.Quest],
+    output: str | None = None,
+    keep: int | None = None,
+    time_limit: float | None = None,
+    threads: int | None = None,
+    portfolio: bool = False,
+) -> PlanResult:
+    """Same as asp_plan with plan_inc.lp: one step is grounded at a time so
+    the ground program grows linearly with the number of objectives"""
+    started = time.perf_counter()
+    report = {"planner": "asp_incremental"}
+    n_step = len(objective_runs(quests))
+    with timed(report, "convert_to_asp"):
+        facts = convert_to_asp(quests)
+    report["facts"] = fact_counts(facts)
+    with timed(report, "add"):
+        ctl = clingo.Control(solver_options(threads, portfolio))
+        ctl.load("plan_inc.lp")
+        add_facts(ctl, facts)
+    with timed(report, "ground"):
+        ctl.ground([("base", [])])
+        for step in range(1, n_step + 1):
+            ctl.ground([("step", [clingo.Number(step)])])
+        # one run of objectives per step: no plan exists before the horizon reaches n_step
+        ctl.ground([("check", [clingo.Number(n_step)])])
+    ctl.assign_external(clingo.Function("query", [clingo.Number(n_step)]), True)
+    return solve_plans(ctl, quests, output, keep, time_limit, report, started)
+
+
+def path_from_model(
+    model: clingo.Model, runs: Dict[Tuple[int, int], List[mod.Objective]]
+) -> Dict[int, mod.Objective]:
+    """Decode the do/2 atoms of a model as {step: objective}, runs of
+    objectives being expanded back"""
+    steps = {}
+    for atom in model.symbols(atoms=True):
+        if atom.match("do", 2):
+            id_obj, id_quest = atom.arguments[0].arguments
+            steps[atom.arguments[1].number] = runs[(id_quest.number, id_obj.number)]
+    chemin = {}
+    for step in sorted(steps):
+        for obj in steps[step]:
+            chemin[len(chemin)] = obj
+    return chemin
+
+
+def path_to_json(path: Dict[int, mod.Objective]) -> Dict[int, Dict]:
+    return {step: obj.__dict__() for step, obj in path.items()}
+
 
-        for line in asp_base:
-            asp_code += line
+def solve_plans(
+    ctl: clingo.Control,
+    quests: Dict[int, mod.Quest],
+    output: str | None = None,
+    keep: int | None = None,
+    time_limit: float | None = None,
+    report: Dict[str, Any] | None = None,
+    started: float | None = None,
+) -> PlanResult:
+    """Paths of the optimal models, followed by the last model found.
 
-    ctl = clingo.Control(
-        [
-            "-n 0",
-            "-t4",
-            
+    Models are decoded as they are found; when output is given the file is
+    overwritten and each of them is written to it as a NDJSON line. With
+    keep, only the keep last models (the best ones, models only improve) are
+    returned.
+
+    With time_limit the search is cancelled time_limit seconds after started
+    (a time.perf_counter() value, the start of the search by default; the
+    planners pass their own start so fact generation and grounding count
+    against the budget) and the best models found so far are returned; the
+    search is not started when the budget is already spent. Grounding and
+    the preprocessing done when the search starts cannot be interrupted and
+    clingo only checks the cancellation between its own steps, so the call
+    can still overrun the limit: by a second on small instances, by minutes
+    when the ground program is huge or with many threads on few cores.
+
+    The report of the result gets the solve time, the time and cost of every
+    model since the start of the search, the clingo statistics and the real
+    time elapsed since started.
+    """
+    report = {} if report is None else report
+    report["models"] = []
+    runs = objective_runs(quests)
+    optimal_paths = deque(maxlen=keep)
+    last_path = deque(maxlen=1 if keep is None else keep)
+    last_cost = [None]
+    out_file = None
+    if output is not None:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        out_file = open(output, "w")
+
+    def on_model(model: clingo.Model):
+        print(f"reached optimality : {model.optimality_proven}")
+        print(f"cout actuel : {model.cost}\n")
+        report["models"].append(
+            {
+                "time": time.perf_counter() - solve_start,
+                "cost": model.cost,
+                "optimality_proven": model.optimality_proven,
+            }
+        )
+        path = path_from_model(model, runs)
+        if out_file is not None:
+            record = {
+                "cost": model.cost,
+                "optimality_proven": model.optimality_proven,
+                "path": path_to_json(path),
+            }
+            out_file.write(json.dumps(record) + "\n")
+            out_file.flush()
+        if model.optimality_proven:
+            optimal_paths.append(path)
+        last_path.append(path)
+        last_cost[0] = model.cost[0] if model.cost else 0
+
+    solve_start = time.perf_counter()
+    started = solve_start if started is None else started
+    remaining = None
+    if time_limit is not None:
+        remaining = max(0.0, time_limit - (solve_start - started))
+    if remaining == 0:
+        # starting the search would still cost clingo's preprocessing
+        print("time limit reached before the search")
+        if out_file is not None:
+            out_file.close()
+        # same report as after a search, with the statistics of the grounding only
+        report.setdefault("phases", {})["solve"] = 0.0
+        report["statistics"] = solver_statistics(ctl)
+        report["elapsed"] = time.perf_counter() - started
+        return PlanResult([], None, False, None, report)
+    try:
+        with timed(report, "solve"):
+            with ctl.solve(on_model=on_model, async_=True) as handle:
+                if not handle.wait(remaining):
+                    print("time limit reached")
+                    handle.cancel()
+                result = handle.get()
+    finally:
+        if out_file is not None:
+            out_file.close()
+    report["statistics"] = solver_statistics(ctl)
+
+    summary = ctl.statistics["summary"]
+    optimal = (result.exhausted and result.satisfiable) or len(optimal_paths) > 0
+    if optimal:
+        lower_bound = last_cost[0]
+    elif len(summary.get("lower", [])) > 0:
+        lower_bound = int(summary["lower"][0])
+    else:
+        lower_bound = None
+    if len(report["models"]) > 0:
+        report["time_to_first_model"] = report["models"][0]["time"]
+        if optimal:
+            # the optimum is enumerated again once proven, keep its first model
+            best_cost = report["models"][-1]["cost"]
+            report["time_to_optimum"] = next(
+                model["time"] for model in report["models"] if model["cost"] == best_cost
+            )
+    report["elapsed"] = time.perf_counter() - started
+    paths = list(last_path) if keep is not None else list(optimal_paths) + list(last_path)
+    return PlanResult(paths, last_cost[0], optimal, lower_bound, report)
+
+
+def heuristic_plan(quests: Dict[int, mod.Quest]) -> PlanResult:
+    """Greedy and local search planner, for the categories clingo cannot solve"""
+    path, cost = planner.heuristic_plan(quests, compute_dist())
+    print(f"cout heuristique : {cost}")
+    return PlanResult([path], cost, False, None)
+
+
+def exact_plan(quests: Dict[int, mod.Quest]) -> PlanResult:
+    """Proven optimal path without clingo, for small quest chains"""
+    path, cost = planner.exact_plan(quests, compute_dist())
+    print(f"cout optimal : {cost}")
+    return PlanResult([path], cost, True, cost)
+
+
+def quest_components(quests: Dict[int, mod.Quest]) -> List[Dict[int, mod.Quest]]:
+    """Groups of quests linked by preconditions, groups without objective
+    are dropped"""
+    components = []
+    for quest_ids in QuestGraph(quests).weakly_connected_components():
+        component = {quest_id: quests[quest_id] for quest_id in quest_ids}
+        if any(len(quest.objectives) > 0 for quest in component.values()):
+            components.append(component)
+    return components
+
+
+def open_worker_database(path: str):
+    """Process pool initializer: a sqlite connection must not be used across
+    fork(), each worker opens its own"""
+    global db
+    db = loader.database(path)
+
+
+def solve_component(
+    planner_name: str,
+    quests: Dict[int, mod.Quest],
+    threads: int = 1,
+    time_limit: float | None = None,
+) -> PlanResult:
+    if planner_name.startswith("asp"):
+        return PLANNERS[planner_name](quests, time_limit=time_limit, threads=threads)
+    return PLANNERS[planner_name](quests)
+
+
+def decomposed_plan(
+    quests: Dict[int, mod.Quest],
+    planner_name: str = "asp_incremental",
+    workers: int | None = None,
+    time_limit: float | None = None,
+) -> PlanResult:
+    """Solve each group of linked quests with planner_name in its own process
+    and concatenate their paths in the order minimizing the moves between
+    them. The cores are shared between the workers, as clingo threads, and
+    time_limit is given to each asp solve. A group without any path found
+    (time limit, unsatisfiable) is planned with heuristic_plan instead. The
+    result is only proven optimal when there is a single group solved to
+    optimality."""
+    components = quest_components(quests)
+    print(f"{len(components)} component(s)")
+    workers = workers or available_cores()
+    threads = max(1, available_cores() // workers)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=open_worker_database, initargs=(db.path,)
+    ) as pool:
+        results = list(
+            pool.map(
+                solve_component,
+                repeat(planner_name),
+                components,
+                repeat(threads),
+                repeat(time_limit),
+            )
+        )
+    for i, (component, result) in enumerate(zip(components, results)):
+        if len(result.paths) == 0:
+            print(f"no path for component {i}, falling back to the heuristic")
+            results[i] = heuristic_plan(component)
+            results[i].report = {"planner": "heuristic", "fallback_from": result.report}
+    # the objectives of the workers paths are copies, give back the caller's ones
+    for component, result in zip(components, results):
+        originals = {
+            obj.idx: obj for quest in component.values() for obj in quest.objectives
+        }
+        result.paths = [
+            {step: originals[obj.idx] for step, obj in path.items()}
+            for path in result.paths
         ]
-    )
-    ctl.add("base", [], asp_code)
-    ctl.ground([("base", [])])
-    possible_path=[]
-    with ctl.solve(yield_=True) as handle:
-        print(handle)
-        valid_model = 0
-        for model in handle:
-            print(f'reached optimality : {model.optimality_proven}')
-            print(f"cout actuel : {model.cost}\n")
-            if model.optimality_proven:
-                chemin = {}
-                print(model)
-                for atom in model.symbols(atoms=True):
-                    if atom.match("do", 2):
-                        id_obj, id_quest = atom.arguments[0].arguments
-                        for obj in quests[id_quest.number].objectives:
-                            if obj.idx == id_obj.number:
-                                chemin[atom.arguments[1].number - 1] = obj
-                possible_path.append(chemin)
-
-                valid_model+=1
-        chemin = {}
-        for atom in model.symbols(atoms=True):
-            if atom.match("do", 2):
-                id_obj, id_quest = atom.arguments[0].arguments
-                for obj in quests[id_quest.number].objectives:
-                    if obj.idx == id_obj.number:
-                        chemin[atom.arguments[1].number - 1] = obj
-        possible_path.append(chemin)
-            
-        return possible_path
-
-
-def convert_to_asp(quests: Dict[int, mod.Quest]) -> str:
-    """Fonction qui convertit nos quetes / objectif en regles ASP"""
+    if len(results) == 1:
+        return results[0]
+
+    dist_mat = compute_dist()
+    # the last path of a result is the best one found
+    best_paths = [result.paths[-1] for result in results]
+
+    problem = planner.PlanProblem(quests, dist_mat)
+    node_of = {id(obj): node for node, obj in enumerate(problem.objectives)}
+    order = []
+    for i in planner.order_components(best_paths, dist_mat):
+        order.extend(node_of[id(obj)] for _, obj in sorted(best_paths[i].items()))
+    # moves between groups can still be improved by interleaving them
+    order = planner.or_opt(problem, order)
+    report = {
+        "planner": f"decomposed/{planner_name}",
+        "components": [result.report for result in results],
+    }
+    return PlanResult([problem.to_path(order)], problem.cost(order), False, None, report)
+
+
+PLANNERS = {
+    "asp": asp_plan,
+    "asp_incremental": asp_plan_incremental,
+    "heuristic": heuristic_plan,
+    "exact": exact_plan,
+    "decomposed": decomposed_plan,
+}
+
+
+def convert_to_asp(quests: Dict[int, mod.Quest]) -> List[clingo.Symbol]:
+    """Fonction qui convertit nos quetes / objectif en faits ASP"""
     print("create quests")
-    asp_code = get_quests(quests)
+    facts = get_quests(quests)
     print("create zones")
 
-    asp_code += get_zones(quests)
+    facts += get_zones(quests)
     print("finish gen")
-    return asp_code
+    return facts
 
 
 class MyEncoder(JSONEncoder):
@@ -122,17 +521,22 @@ class MyEncoder(JSONEncoder):
 if __name__ == "__main__":
     quests = db.load_quest_from_category(19)
 
-    paths = asp_plan(quests)
+    planner_name = sys.argv[1] if len(sys.argv) > 1 else "asp"
+    if planner_name.startswith("asp"):
+        result = PLANNERS[planner_name](
+            quests, output="path_to_incarnam/models.ndjson", keep=5
+        )
+    else:
+        result = PLANNERS[planner_name](quests)
+    paths = result.paths
     to_json = []
     for i,path in enumerate(paths):
         dot = grapher.graph_from_quests_for_asp("optimal", quests, path)
         dot.render(f"path_to_incarnam/path_{i}")
-
-        temp_path={}
-        for i, obj in path.items():
-            temp_path[i]=obj.__dict__()
-        to_json.append(temp_path)
+        to_json.append(path_to_json(path))
 
     json_paths =json.dumps(to_json)
     with open('path_to_incarnam/paths.json', "w+") as file:
-        file.write(json_paths)
\ No newline at end of file
+        file.write(json_paths)
+    with open("path_to_incarnam/report.json", "w") as file:
+        json.dump(result.report, file, indent=2)
\ No newline at end of file